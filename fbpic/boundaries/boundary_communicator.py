@@ -5,11 +5,12 @@
 This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
 It defines the structure necessary to implement the boundary exchanges.
 """
+import atexit
 import warnings
 import numpy as np
 from scipy.constants import c
-from fbpic.utils.mpi import comm, mpi_type_dict, \
-    mpi_installed, gpudirect_enabled
+from fbpic.utils.mpi import comm, mpi_type_dict, MPI, mpi_installed, \
+    gpudirect_enabled, mapped_buffers_enabled, mpi_rma_enabled
 from fbpic.fields.fields import InterpolationGrid
 from fbpic.fields.utility_methods import get_stencil_reach
 from fbpic.particles.particles import Particles
@@ -20,10 +21,8 @@ from .particle_buffer_handling import remove_outside_particles, \
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
-    import cupy
-    from fbpic.utils.cuda import cuda, cuda_tpb_bpg_2d
-    from .cuda_methods import cuda_damp_EB_left, cuda_damp_EB_right, \
-                                cuda_damp_EB_left_pml, cuda_damp_EB_right_pml
+    from fbpic.utils.cuda import cuda_tpb_bpg_2d
+    from .cuda_methods import make_cuda_damp_EB
 
 class BoundaryCommunicator(object):
     """
@@ -311,7 +310,16 @@ class BoundaryCommunicator(object):
         if self.size > 1:
             Nr_with_damp = self.get_Nr( with_damp=True )
             self.mpi_buffers = BufferHandler( self.n_guard, Nr_with_damp, Nm,
-                               self.left_proc, self.right_proc, self.use_pml )
+                               self.left_proc, self.right_proc, self.use_pml,
+                               use_mapped_buffers=mapped_buffers_enabled,
+                               use_gpudirect=gpudirect_enabled )
+            # MPI windows and target regions for the one-sided summation
+            # of the guard cells (only used on CPU, with FBPIC_ENABLE_MPI_RMA=1)
+            self.rma_windows = {}
+            self.rma_targets = {}
+            if mpi_rma_enabled:
+                # Free them before MPI is finalized
+                atexit.register( self.free_rma_windows )
 
         # Create damping arrays for the damping cells at the left
         # and right of the box in the case of "open" boundaries.
@@ -320,14 +328,17 @@ class BoundaryCommunicator(object):
                 # Create the damping arrays for left proc
                 self.left_damp = self.generate_damp_array(
                     self.n_guard, self.nz_damp, self.n_inject )
-                if cuda_installed:
-                    self.d_left_damp = cupy.asarray( self.left_damp )
             if self.right_proc is None:
                 # Create the damping arrays for right proc
                 self.right_damp = self.generate_damp_array(
                     self.n_guard, self.nz_damp, self.n_inject )
-                if cuda_installed:
-                    self.d_right_damp = cupy.asarray( self.right_damp )
+            if cuda_installed and (self.left_proc is None or \
+                                   self.right_proc is None):
+                # Create the GPU damping kernel, in which the damping
+                # factors are compiled (identical on the left and right)
+                damp_arr = self.generate_damp_array(
+                    self.n_guard, self.nz_damp, self.n_inject )
+                self.cuda_damp_EB = make_cuda_damp_EB( damp_arr )
 
         # Create damping object for the PML
         self.use_pml = (boundaries['r'] == "open")
@@ -594,7 +605,8 @@ class BoundaryCommunicator(object):
 
         fldtype: str
             An identifier for the field to send
-            (Either 'E', 'B', 'J' or 'rho')
+            (Either 'EB', 'J' or 'rho' ; 'EB' exchanges the E and B fields
+            together, in a single message)
 
         method: str
             Can either be 'replace' or 'add' depending on the type
@@ -605,40 +617,33 @@ class BoundaryCommunicator(object):
             return
 
         # Build the string `exchange_type`:
-        # This is either 'E:replace', 'B:replace', 'J:add', or 'rho:add'
+        # This is either 'EB:replace', 'J:add', or 'rho:add'
         exchange_type = ':'.join([ fldtype, method ])
 
         # Shortcut
-        Nm = self.Nm
         use_cuda = interp[0].use_cuda
 
+        # On CPU, the fields can be directly summed into the fields of the
+        # neighboring domains, with one-sided MPI communications
+        if mpi_rma_enabled and (method == 'add') and (not use_cuda):
+            self.accumulate_fields_rma( interp, fldtype )
+            return
+
         # Fill the sending buffers with data from the interpolation grid
-        if fldtype in ('E', 'B', 'J'):
-            # Vector field
-            grid_r = [ getattr(interp[m], fldtype+'r') for m in range(Nm) ]
-            grid_t = [ getattr(interp[m], fldtype+'t') for m in range(Nm) ]
-            grid_z = [ getattr(interp[m], fldtype+'z') for m in range(Nm) ]
-            # Handle PML fields
-            if fldtype in ('E', 'B') and self.use_pml:
-                pml_r = [getattr(interp[m], fldtype+'r_pml') for m in range(Nm)]
-                pml_t = [getattr(interp[m], fldtype+'t_pml') for m in range(Nm)]
-            else:
-                pml_r = None
-                pml_t = None
-            self.mpi_buffers.handle_vec_buffer( grid_r, grid_t, grid_z,
-                    pml_r, pml_t, method, exchange_type, use_cuda,
+        if fldtype in ('EB', 'J'):
+            # Vector field: use the stacked components of all modes
+            # (For EB, these are the E and B components, including the
+            # PML components, if any)
+            grids = getattr( interp[0], fldtype+'_modes' )
+            self.mpi_buffers.handle_vec_buffer( grids,
+                    method, exchange_type, use_cuda,
                     before_sending=True, gpudirect=gpudirect_enabled )
         else:
-            # Scalar field
-            grid = [ getattr(interp[m], fldtype) for m in range(Nm) ]
+            # Scalar field (all modes)
+            grid = getattr( interp[0], fldtype+'_modes' )
             self.mpi_buffers.handle_scal_buffer(
                     grid, method, exchange_type, use_cuda,
                     before_sending=True, gpudirect=gpudirect_enabled )
-        if gpudirect_enabled:
-            # Synchronize GPU execution (break asynchroneous kernel
-            # execution to make sure that writing the buffer arrays
-            # completed before sendind via MPI directly)
-            cuda.synchronize()
 
         # Prepare MPI call by pointing to the correct sending/receiving buffers
         if gpudirect_enabled:
@@ -658,10 +663,9 @@ class BoundaryCommunicator(object):
         self.exchange_domains( send_l, send_r, recv_l, recv_r )
 
         # Copy/Add the received buffers to the interpolation grid
-        if fldtype in ('E', 'B', 'J'):
+        if fldtype in ('EB', 'J'):
             # Vector field
-            self.mpi_buffers.handle_vec_buffer(
-                    grid_r, grid_t, grid_z, pml_r, pml_t,
+            self.mpi_buffers.handle_vec_buffer( grids,
                     method, exchange_type, use_cuda,
                     after_receiving=True, gpudirect=gpudirect_enabled )
         else:
@@ -671,6 +675,147 @@ class BoundaryCommunicator(object):
                     after_receiving=True, gpudirect=gpudirect_enabled )
 
 
+    def accumulate_fields_rma( self, interp, fldtype ):
+        """
+        Add the guard cells and the inner cells of the local domain
+        (region "ng" + "nc", on each side) to the same region of the
+        neighboring domains (see `exchange_fields`), on the CPU.
+
+        Instead of exchanging buffers and adding the received buffers to
+        the local grid, the buffers are directly summed into the fields of
+        the neighboring domains by MPI, with one-sided communications
+        (MPI_Accumulate with MPI_SUM). The synchronization only involves
+        the neighboring domains.
+
+        Parameters:
+        ------------
+        interp: list
+            A list of InterpolationGrid objects
+            (one element per azimuthal mode)
+
+        fldtype: str
+            An identifier for the field to send (Either 'J' or 'rho')
+        """
+        # Shortcut
+        exchange_type = fldtype + ':add'
+
+        # Fill the sending buffers with data from the interpolation grid
+        # (before exposing the local fields to the neighboring domains)
+        if fldtype == 'J':
+            grids = interp[0].J_modes
+            self.mpi_buffers.handle_vec_buffer( grids, 'add', exchange_type,
+                    use_cuda=False, before_sending=True )
+        else:
+            grid = interp[0].rho_modes
+            self.mpi_buffers.handle_scal_buffer( grid, 'add', exchange_type,
+                    use_cuda=False, before_sending=True )
+            # Consider the scalar field as a stack with one component
+            Nm, Nz, Nr = grid.shape
+            grids = grid.reshape( (Nm, 1, Nz, Nr) )
+
+        # Get the MPI window that exposes the fields (of all modes)
+        win = self.get_rma_window( fldtype, grids )
+        target_l, target_r, group = self.rma_targets[ fldtype ]
+
+        # Expose the local fields to the neighbors, and access theirs
+        win.Post( group )
+        win.Start( group )
+        # Sum the buffers into the fields of the neighbors
+        if self.left_proc is not None:
+            # Right region of the left domain
+            win.Accumulate( self.mpi_buffers.send_l[exchange_type],
+                    self.left_proc, target=target_l, op=MPI.SUM )
+        if self.right_proc is not None:
+            # Left region of the right domain
+            win.Accumulate( self.mpi_buffers.send_r[exchange_type],
+                    self.right_proc, target=target_r, op=MPI.SUM )
+        # Wait until the accumulation to and from the neighbors is complete
+        win.Complete()
+        win.Wait()
+
+    def get_rma_window( self, fldtype, grids ):
+        """
+        Return the MPI window that exposes the array `grids`, i.e. the field
+        `fldtype` in all the azimuthal modes. The window is created on the
+        first call, and again on all domains whenever the array has been
+        reallocated on any of them (e.g. when transferring the fields from
+        the GPU).
+
+        Parameters:
+        ------------
+        fldtype: str
+            An identifier for the field (Either 'J' or 'rho')
+
+        grids: ndarray of complexs
+            Array of shape (Nm, n_comp, Nz, Nr), which contains the
+            (stacked components of the) field, for all modes
+        """
+        address = grids.__array_interface__['data'][0]
+        recreate = ( fldtype not in self.rma_windows ) or \
+                    ( self.rma_windows[ fldtype ][1] != address )
+        # Freeing and creating a window are collective operations: all the
+        # domains need to agree on whether the window is recreated (even
+        # if the array was only reallocated at a new address on some of them)
+        recreate = self.mpi_comm.allreduce( recreate, op=MPI.LOR )
+        if not recreate:
+            return( self.rma_windows[ fldtype ][0] )
+        if fldtype in self.rma_windows:
+            self.rma_windows[ fldtype ][0].Free()
+
+        # Create the window (collective operation)
+        win = MPI.Win.Create( grids, disp_unit=grids.itemsize,
+                              comm=self.mpi_comm )
+        self.rma_windows[ fldtype ] = ( win, address )
+
+        # Determine the region of the neighbors' fields, to which the
+        # buffers are added (target displacement, count, and MPI datatype)
+        # (The components of all the modes are uniformly strided in memory)
+        if fldtype not in self.rma_targets:
+            Nm, n_comp, _, Nr = grids.shape
+            nz_span = 2*self.n_guard
+            target_l = None
+            target_r = None
+            if self.left_proc is not None:
+                Nz_left, _ = self.get_Nz_and_iz( local=True, with_damp=True,
+                                with_guard=True, rank=self.left_proc )
+                datatype = MPI.C_DOUBLE_COMPLEX.Create_vector(
+                    Nm*n_comp, nz_span*Nr, Nz_left*Nr ).Commit()
+                target_l = ( (Nz_left - nz_span)*Nr, 1, datatype )
+            if self.right_proc is not None:
+                Nz_right, _ = self.get_Nz_and_iz( local=True, with_damp=True,
+                                with_guard=True, rank=self.right_proc )
+                datatype = MPI.C_DOUBLE_COMPLEX.Create_vector(
+                    Nm*n_comp, nz_span*Nr, Nz_right*Nr ).Commit()
+                target_r = ( 0, 1, datatype )
+            # Group of the neighboring domains
+            neighbors = sorted( set( proc for proc in
+                [ self.left_proc, self.right_proc ] if proc is not None ) )
+            group = self.mpi_comm.Get_group().Incl( neighbors )
+            self.rma_targets[ fldtype ] = ( target_l, target_r, group )
+
+        return( win )
+
+    def free_rma_windows( self ):
+        """
+        Free the MPI windows, datatypes and groups that are used for the
+        one-sided summation of the guard cells (see `accumulate_fields_rma`).
+
+        This is a collective operation. It is called automatically at exit,
+        when FBPIC_ENABLE_MPI_RMA=1.
+        """
+        if MPI.Is_finalized():
+            return
+        for win, _ in self.rma_windows.values():
+            win.Free()
+        self.rma_windows = {}
+        for target_l, target_r, group in self.rma_targets.values():
+            for target in [ target_l, target_r ]:
+                # The datatype is the last element of the target
+                if target is not None:
+                    target[2].Free()
+            group.Free()
+        self.rma_targets = {}
+
     def exchange_domains( self, send_left, send_right, recv_left, recv_right ):
         """
         Send the arrays send_left and send_right to the left and right
@@ -839,72 +984,43 @@ class BoundaryCommunicator(object):
         if self.nz_damp != 0:
             # Total size of the damping and guard region
             nd = self.n_guard + self.nz_damp + self.n_inject
+            # Fields of all the modes
+            EB_modes = interp[0].EB_modes
+            if interp[0].use_cuda:
+                # Get the number of blocks and threads per block
+                # (each thread handles two cells along r ; the modes are
+                # handled by the third dimension of the grid)
+                dim_grid_2d, dim_block_2d = cuda_tpb_bpg_2d(
+                    nd, (interp[0].Nr + 1)//2 )
+                dim_grid = dim_grid_2d + (len(interp),)
+                dim_block = dim_block_2d + (1,)
 
             if self.left_proc is None:
                 # Damp the fields on the CPU or the GPU
                 if interp[0].use_cuda:
-                    # Damp the fields on the GPU
-                    dim_grid, dim_block = cuda_tpb_bpg_2d(
-                        nd, interp[0].Nr )
-                    for m in range(len(interp)):
-                        cuda_damp_EB_left[dim_grid, dim_block](
-                            interp[m].Er, interp[m].Et, interp[m].Ez,
-                            interp[m].Br, interp[m].Bt, interp[m].Bz,
-                            self.d_left_damp, nd)
-                        if interp[m].use_pml:
-                            cuda_damp_EB_left_pml[dim_grid, dim_block](
-                                interp[m].Er_pml, interp[m].Et_pml,
-                                interp[m].Br_pml, interp[m].Bt_pml,
-                                self.d_left_damp, nd)
+                    # Damp the fields on the GPU (all modes at once)
+                    self.cuda_damp_EB[dim_grid, dim_block]( EB_modes, 0, 1 )
                 else:
                     # Damp the fields on the CPU
                     damp_arr = self.left_damp
-                    for m in range(len(interp)):
-                        # Damp the fields in left guard cells
-                        interp[m].Er[:nd,:]*=damp_arr[:,np.newaxis]
-                        interp[m].Et[:nd,:]*=damp_arr[:,np.newaxis]
-                        interp[m].Ez[:nd,:]*=damp_arr[:,np.newaxis]
-                        interp[m].Br[:nd,:]*=damp_arr[:,np.newaxis]
-                        interp[m].Bt[:nd,:]*=damp_arr[:,np.newaxis]
-                        interp[m].Bz[:nd,:]*=damp_arr[:,np.newaxis]
-                        if interp[m].use_pml:
-                            interp[m].Er_pml[:nd,:]*=damp_arr[:,np.newaxis]
-                            interp[m].Et_pml[:nd,:]*=damp_arr[:,np.newaxis]
-                            interp[m].Br_pml[:nd,:]*=damp_arr[:,np.newaxis]
-                            interp[m].Bt_pml[:nd,:]*=damp_arr[:,np.newaxis]
+                    # Damp the fields in left guard cells
+                    # (including the PML components, if any)
+                    EB_modes[:,:,:nd,:] *= \
+                        damp_arr[np.newaxis,np.newaxis,:,np.newaxis]
 
             if self.right_proc is None:
                 # Damp the fields on the CPU or the GPU
                 if interp[0].use_cuda:
-                    # Damp the fields on the GPU
-                    dim_grid, dim_block = cuda_tpb_bpg_2d(
-                        nd, interp[0].Nr )
-                    for m in range(len(interp)):
-                        cuda_damp_EB_right[dim_grid, dim_block](
-                            interp[m].Er, interp[m].Et, interp[m].Ez,
-                            interp[m].Br, interp[m].Bt, interp[m].Bz,
-                            self.d_right_damp, nd)
-                        if interp[m].use_pml:
-                            cuda_damp_EB_right_pml[dim_grid, dim_block](
-                                interp[m].Er_pml, interp[m].Et_pml,
-                                interp[m].Br_pml, interp[m].Bt_pml,
-                                self.d_right_damp, nd)
+                    # Damp the fields on the GPU (all modes at once)
+                    self.cuda_damp_EB[dim_grid, dim_block](
+                        EB_modes, interp[0].Nz - 1, -1 )
                 else:
                     # Damp the fields on the CPU
                     damp_arr = self.right_damp
-                    for m in range(len(interp)):
-                        # Damp the fields in left guard cells
-                        interp[m].Er[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                        interp[m].Et[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                        interp[m].Ez[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                        interp[m].Br[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                        interp[m].Bt[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                        interp[m].Bz[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                        if interp[m].use_pml:
-                            interp[m].Er_pml[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                            interp[m].Et_pml[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                            interp[m].Br_pml[-nd:,:]*=damp_arr[::-1,np.newaxis]
-                            interp[m].Bt_pml[-nd:,:]*=damp_arr[::-1,np.newaxis]
+                    # Damp the fields in right guard cells
+                    # (including the PML components, if any)
+                    EB_modes[:,:,-nd:,:] *= \
+                        damp_arr[np.newaxis,np.newaxis,::-1,np.newaxis]
 
     def generate_damp_array( self, n_guard, nz_damp, n_inject ):
         """
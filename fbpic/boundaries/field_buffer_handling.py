@@ -5,21 +5,15 @@
 This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
 It defines the structure necessary to handle mpi buffers for the fields
 """
+import warnings
 import numpy as np
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
     import cupy
-    from fbpic.utils.cuda import cuda, cuda_tpb_bpg_2d
-    from .cuda_methods import \
-        copy_vec_to_gpu_buffer, \
-        replace_vec_from_gpu_buffer, \
-        add_vec_from_gpu_buffer, \
-        copy_scal_to_gpu_buffer, \
-        replace_scal_from_gpu_buffer, \
-        add_scal_from_gpu_buffer, \
-        copy_pml_to_gpu_buffer, \
-        replace_pml_from_gpu_buffer
+    from fbpic.utils.cuda import cuda, memcpy_2d_async, is_integrated_gpu, \
+        has_concurrent_managed_access
+    from .cuda_methods import add_vec_from_gpu_buffer
 
 class BufferHandler(object):
     """
@@ -27,7 +21,8 @@ class BufferHandler(object):
     between MPI domains.
     """
 
-    def __init__( self, n_guard, Nr, Nm, left_proc, right_proc, use_pml ):
+    def __init__( self, n_guard, Nr, Nm, left_proc, right_proc, use_pml,
+                  use_mapped_buffers=False, use_gpudirect=False ):
         """
         Initialize the guard cell buffers for the fields.
         These buffers are used in order to group the MPI exchanges.
@@ -49,6 +44,24 @@ class BufferHandler(object):
 
         use_pml: bool
            Whether to use PML fields
+
+        use_mapped_buffers: bool, optional
+           Whether to allocate the buffers as page-locked host memory
+           that is mapped into the address space of the GPU (zero-copy).
+           In this case, the 2D memory copies (and the kernel that adds the
+           received buffers to the fields) directly read/write the host
+           buffers that are passed to MPI, and no explicit copy between
+           the host and device buffers is needed. On integrated GPUs
+           (which share their physical memory with the host), the buffers
+           are allocated as managed memory instead, if the host can access
+           it while kernels are running (otherwise, regular page-locked
+           buffers are used). (Only used with CUDA.)
+
+        use_gpudirect: bool, optional
+           Whether the GPU buffers are directly passed to a CUDA-aware
+           MPI implementation. In this case, the CPU buffers are never
+           used for transfers with the GPU, and are thus not allocated
+           as page-locked memory. (Only used with CUDA.)
         """
         # Register parameters
         self.Nr = Nr
@@ -56,6 +69,7 @@ class BufferHandler(object):
         self.n_guard = n_guard
         self.left_proc = left_proc
         self.right_proc = right_proc
+        self.use_mapped_buffers = (use_mapped_buffers and cuda_installed)
         # Shortcut
         ng = self.n_guard
 
@@ -68,38 +82,59 @@ class BufferHandler(object):
         # Allocate buffer arrays that are send via MPI to exchange
         # the fields between domains (either replacing or adding fields)
         # Buffers are allocated for the left and right side of the domain
+        # (E and B are exchanged together, in a single message)
+        buffer_shapes = {
+            'EB:replace': (2*n_fld*Nm, ng, Nr),
+            'J:add'     : (     3*Nm, 2*ng, Nr),
+            'rho:add'   : (       Nm, 2*ng, Nr) }
+
+        # On integrated GPUs, the mapped buffers are allocated as managed
+        # memory (see below). The MPI calls access these buffers while
+        # kernels may still be running on the GPU: if the device does not
+        # support this (e.g. older NVIDIA Jetson systems), fall back to
+        # regular page-locked buffers, with explicit copies.
+        if self.use_mapped_buffers and is_integrated_gpu() \
+                and not has_concurrent_managed_access():
+            warnings.warn(
+                "FBPIC_ENABLE_MAPPED_BUFFERS is ignored on this integrated "
+                "GPU,\nsince it does not support concurrent access to "
+                "managed memory.\nThe MPI buffers are allocated as regular "
+                "page-locked memory instead.")
+            self.use_mapped_buffers = False
 
         # Allocate buffers on the CPU
-        if cuda_installed:
+        if self.use_mapped_buffers and is_integrated_gpu():
+            # On integrated GPUs, the host and the device share the same
+            # physical memory: use cuda.managed_array, so that the MPI
+            # calls and the GPU kernels access the same pages, without
+            # going through the mapping of pagelocked host memory.
+            alloc_cpu = cuda.managed_array
+        elif self.use_mapped_buffers:
+            # Use cuda.mapped_array so that the CPU array is pagelocked
+            # and mapped into the device address space.
+            # (the GPU can directly read from and write to it)
+            alloc_cpu = cuda.mapped_array
+        elif cuda_installed and not use_gpudirect:
             # Use cuda.pinned_array so that CPU array is pagelocked.
             # (cannot be swapped out to disk and GPU can access it via DMA)
             alloc_cpu = cuda.pinned_array
         else:
             # Use regular numpy arrays
+            # (With GPUDirect, the GPU buffers are directly passed to MPI)
             alloc_cpu = np.empty
         # Allocate buffers of different size, for the different exchange types
-        self.send_l = {
-            'E:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'B:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'J:add'    : alloc_cpu( (    3*Nm, 2*ng, Nr), dtype=np.complex128),
-            'rho:add'  : alloc_cpu( (      Nm, 2*ng, Nr), dtype=np.complex128)}
-        self.send_r = {
-            'E:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'B:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'J:add'    : alloc_cpu( (    3*Nm, 2*ng, Nr), dtype=np.complex128),
-            'rho:add'  : alloc_cpu( (      Nm, 2*ng, Nr), dtype=np.complex128)}
-        self.recv_l = {
-            'E:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'B:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'J:add'    : alloc_cpu( (    3*Nm, 2*ng, Nr), dtype=np.complex128),
-            'rho:add'  : alloc_cpu( (      Nm, 2*ng, Nr), dtype=np.complex128)}
-        self.recv_r = {
-            'E:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'B:replace': alloc_cpu( (n_fld*Nm,   ng, Nr), dtype=np.complex128),
-            'J:add'    : alloc_cpu( (    3*Nm, 2*ng, Nr), dtype=np.complex128),
-            'rho:add'  : alloc_cpu( (      Nm, 2*ng, Nr), dtype=np.complex128)}
+        self.send_l = { key: alloc_cpu( shape, dtype=np.complex128 ) \
+                            for key, shape in buffer_shapes.items() }
+        self.send_r = { key: alloc_cpu( shape, dtype=np.complex128 ) \
+                            for key, shape in buffer_shapes.items() }
+        self.recv_l = { key: alloc_cpu( shape, dtype=np.complex128 ) \
+                            for key, shape in buffer_shapes.items() }
+        self.recv_r = { key: alloc_cpu( shape, dtype=np.complex128 ) \
+                            for key, shape in buffer_shapes.items() }
 
         # Allocate buffers on the GPU, for the different exchange types
+        # (For mapped buffers, `cupy.asarray` does not allocate new arrays,
+        # but returns device views of the mapped CPU buffers.)
         if cuda_installed:
             self.d_send_l = { key: cupy.asarray(value) for key, value in \
                                 self.send_l.items() }
@@ -109,10 +144,32 @@ class BufferHandler(object):
                                 self.recv_l.items() }
             self.d_recv_r = { key: cupy.asarray(value) for key, value in \
                                 self.recv_r.items() }
+        # Precompute the CUDA launch configuration of the buffer kernels,
+        # for the two possible widths of the exchanged regions (ng, 2*ng).
+        # Each thread handles two cells along r (ir and ir + nr_half) ;
+        # the threads of a block are contiguous along r (so that memory
+        # accesses are coalesced) and the number of blocks is exactly
+        # the one that covers the region.
+        # The azimuthal modes are handled by the third dimension of the grid.
+        nr_half = (Nr + 1)//2
+        TPBr = min( 128, 32*( (nr_half+31)//32 ) )
+        self.cuda_launch_config = {
+            nz_span: ( (nz_span, (nr_half+TPBr-1)//TPBr, Nm), (1, TPBr, 1) ) \
+                for nz_span in (ng, 2*ng) }
+
+        # Create a dedicated stream on which the buffers are handled
+        # (synchronized with the main stream through events)
+        if cuda_installed:
+            self.mpi_stream = cupy.cuda.Stream( non_blocking=True )
+        if self.use_mapped_buffers:
+            # Pass regular numpy views of the mapped buffers to MPI
+            for cpu_buffers in [ self.send_l, self.send_r,
+                                 self.recv_l, self.recv_r ]:
+                for key, value in cpu_buffers.items():
+                    cpu_buffers[key] = value.view( np.ndarray )
 
 
-    def handle_vec_buffer(self, grid_r, grid_t, grid_z,
-                            pml_r, pml_t, method, exchange_type,
+    def handle_vec_buffer(self, grids, method, exchange_type,
                             use_cuda, before_sending=False,
                             after_receiving=False, gpudirect=False ):
         """
@@ -140,20 +197,17 @@ class BufferHandler(object):
 
         Parameters
         ----------
-        grid_r, grid_t, grid_z: lists of 2darrays
-            (One element per azimuthal mode)
-            The 2d arrays represent the fields on the interpolation grid
-
-        pml_r, pml_t: lists of 2darrays, or None
-            The 2d arrays that represent the PML components (if present)
-            on the interpolation grid
+        grids: 4darray
+            Array of shape (Nm, n_comp, Nz, Nr), which represents the stacked
+            components of the field on the interpolation grid
+            (e.g. r, t, z and possibly the PML components), for all modes
 
         method: str
             Can either be 'replace' or 'add' depending on the type
             of field exchange that is needed
 
         exchange_type: str
-            Can either be 'E:replace', 'B:replace', 'J:add' or 'rho:add'
+            Can either be 'EB:replace', 'J:add' or 'rho:add'
             Determines which buffer array is used.
 
         use_cuda: bool
@@ -186,166 +240,116 @@ class BufferHandler(object):
         # Whether or not to send to the left or right neighbor
         copy_left = (self.left_proc is not None)
         copy_right = (self.right_proc is not None)
-        Nz = grid_r[0].shape[0]
+        Nm, n_comp, Nz, Nr = grids.shape
+        nz_span = nz_end - nz_start
 
         # When using the GPU
         if use_cuda:
 
-            # Calculate the number of blocks and threads per block
-            dim_grid_2d, dim_block_2d = cuda_tpb_bpg_2d(
-                nz_end - nz_start, self.Nr )
-
-            if before_sending:
-                # Copy the inner regions of the domain to the buffers
-                for m in range(self.Nm):
-                    if pml_r is None:
-                        # Copy only the regular components
-                        copy_vec_to_gpu_buffer[ dim_grid_2d, dim_block_2d ](
-                            self.d_send_l[exchange_type],
-                            self.d_send_r[exchange_type],
-                            grid_r[m], grid_t[m], grid_z[m], m,
-                            copy_left, copy_right, nz_start, nz_end )
-                    else:
-                        # Copy regular components + PML components
-                        copy_pml_to_gpu_buffer[ dim_grid_2d, dim_block_2d ](
-                            self.d_send_l[exchange_type],
-                            self.d_send_r[exchange_type],
-                            grid_r[m], grid_t[m], grid_z[m],
-                            pml_r[m], pml_t[m], m,
-                            copy_left, copy_right, nz_start, nz_end )
-                # If GPUDirect with CUDA-aware MPI is not used,
-                # copy the GPU buffers to the sending CPU buffers
-                if not gpudirect:
+            # Get the number of blocks and threads per block
+            dim_grid, dim_block = self.cuda_launch_config[ nz_span ]
+            # View the components of all modes as a sequence of 2D planes
+            # (same layout as the buffers)
+            planes = grids.reshape( (Nm*n_comp, Nz, Nr) )
+
+            # Enqueue the buffer handling on the dedicated MPI stream
+            main_stream = cupy.cuda.get_current_stream()
+            with self.mpi_stream:
+
+                if before_sending:
+                    # Wait for the work that was previously enqueued on the
+                    # main stream (e.g. the update of the fields)
+                    self.mpi_stream.wait_event( main_stream.record() )
+                    # Copy the inner regions of the domain to the buffers
+                    # (In each component of each mode, the regions are
+                    # contiguous slabs of full rows, which are uniformly
+                    # strided: use a single 2D memory copy, instead of a kernel)
                     if copy_left:
-                        self.d_send_l[exchange_type].get(
-                            out=self.send_l[exchange_type] )
+                        memcpy_2d_async( self.d_send_l[exchange_type],
+                            planes[:,nz_start:nz_end], self.mpi_stream )
                     if copy_right:
-                        self.d_send_r[exchange_type].get(
-                            out=self.send_r[exchange_type] )
-
-            elif after_receiving:
-                # If GPUDirect with CUDA-aware MPI is not used,
-                # copy the CPU receiving buffers to the GPU buffers
-                if not gpudirect:
-                    if copy_left:
-                        self.d_recv_l[exchange_type].set(
-                            self.recv_l[exchange_type] )
-                    if copy_right:
-                        self.d_recv_r[exchange_type].set(
-                            self.recv_r[exchange_type] )
-                if method == 'replace':
-                    # Replace the guard cells of the domain with the buffers
-                    for m in range(self.Nm):
-                        if pml_r is None:
-                            # Copy only the regular components
-                            replace_vec_from_gpu_buffer \
-                                [dim_grid_2d, dim_block_2d](
-                                self.d_recv_l[exchange_type],
-                                self.d_recv_r[exchange_type],
-                                grid_r[m], grid_t[m], grid_z[m], m,
-                                copy_left, copy_right, nz_start, nz_end )
-                        else:
-                            # Copy regular components + PML components
-                            replace_pml_from_gpu_buffer \
-                                [ dim_grid_2d, dim_block_2d ](
-                                self.d_recv_l[exchange_type],
-                                self.d_recv_r[exchange_type],
-                                grid_r[m], grid_t[m], grid_z[m],
-                                pml_r[m], pml_t[m], m,
-                                copy_left, copy_right, nz_start, nz_end )
-                elif method == 'add':
-                    # Add the buffers to the domain
-                    for m in range(self.Nm):
-                        add_vec_from_gpu_buffer[ dim_grid_2d, dim_block_2d ](
-                            self.d_recv_l[exchange_type],
-                            self.d_recv_r[exchange_type],
-                            grid_r[m], grid_t[m], grid_z[m], m,
-                            copy_left, copy_right, nz_start, nz_end )
+                        memcpy_2d_async( self.d_send_r[exchange_type],
+                            planes[:,Nz-nz_end:Nz-nz_start], self.mpi_stream )
+                    # If GPUDirect with CUDA-aware MPI is not used, and if the
+                    # buffers are not mapped, copy the GPU buffers to the
+                    # sending CPU buffers
+                    if not (gpudirect or self.use_mapped_buffers):
+                        if copy_left:
+                            self.d_send_l[exchange_type].get(
+                                out=self.send_l[exchange_type] )
+                        if copy_right:
+                            self.d_send_r[exchange_type].get(
+                                out=self.send_r[exchange_type] )
+                    # Make sure that the buffers are filled before
+                    # they are passed to MPI
+                    self.mpi_stream.synchronize()
+
+                elif after_receiving:
+                    # If GPUDirect with CUDA-aware MPI is not used, and if the
+                    # buffers are not mapped, copy the CPU receiving buffers
+                    # to the GPU buffers
+                    if not (gpudirect or self.use_mapped_buffers):
+                        if copy_left:
+                            self.d_recv_l[exchange_type].set(
+                                self.recv_l[exchange_type] )
+                        if copy_right:
+                            self.d_recv_r[exchange_type].set(
+                                self.recv_r[exchange_type] )
+                    if method == 'replace':
+                        # Replace the guard cells of the domain with the
+                        # buffers (2D memory copy, as for the sending buffers)
+                        if copy_left:
+                            memcpy_2d_async( planes[:,:nz_span],
+                                self.d_recv_l[exchange_type], self.mpi_stream )
+                        if copy_right:
+                            memcpy_2d_async( planes[:,Nz-nz_span:],
+                                self.d_recv_r[exchange_type], self.mpi_stream )
+                    elif method == 'add':
+                        # Add the buffers to the domain
+                        # (a single launch handles all the azimuthal modes)
+                        if copy_left:
+                            add_vec_from_gpu_buffer[ dim_grid, dim_block ](
+                                self.d_recv_l[exchange_type], grids, 0 )
+                        if copy_right:
+                            add_vec_from_gpu_buffer[ dim_grid, dim_block ](
+                                self.d_recv_r[exchange_type], grids,
+                                Nz - nz_span )
+                    # Make the work that will subsequently be enqueued on
+                    # the main stream wait for the fields to be updated
+                    main_stream.wait_event( self.mpi_stream.record() )
 
         # Without GPU
         else:
 
+            # View the buffers as arrays of shape (Nm, n_comp, nz_span, Nr)
+            buffer_shape = (Nm, n_comp, nz_span, Nr)
+
             if before_sending:
 
-                send_l = self.send_l[exchange_type]
-                send_r = self.send_r[exchange_type]
+                send_l = self.send_l[exchange_type].reshape( buffer_shape )
+                send_r = self.send_r[exchange_type].reshape( buffer_shape )
                 # Copy the inner regions of the domain to the buffers
                 if copy_left:
-                    for m in range(self.Nm):
-                        if pml_r is None:
-                            # Copy only the regular components
-                            send_l[3*m+0,:,:]=grid_r[m][nz_start:nz_end,:]
-                            send_l[3*m+1,:,:]=grid_t[m][nz_start:nz_end,:]
-                            send_l[3*m+2,:,:]=grid_z[m][nz_start:nz_end,:]
-                        else:
-                            # Copy regular components + PML components
-                            send_l[5*m+0,:,:]=grid_r[m][nz_start:nz_end,:]
-                            send_l[5*m+1,:,:]=grid_t[m][nz_start:nz_end,:]
-                            send_l[5*m+2,:,:]=grid_z[m][nz_start:nz_end,:]
-                            send_l[5*m+3,:,:]=pml_r[m][nz_start:nz_end,:]
-                            send_l[5*m+4,:,:]=pml_t[m][nz_start:nz_end,:]
+                    send_l[...] = grids[:,:,nz_start:nz_end,:]
                 if copy_right:
-                    for m in range(self.Nm):
-                        if pml_r is None:
-                            # Copy only the regular components
-                            send_r[3*m+0,:,:]=grid_r[m][Nz-nz_end:Nz-nz_start,:]
-                            send_r[3*m+1,:,:]=grid_t[m][Nz-nz_end:Nz-nz_start,:]
-                            send_r[3*m+2,:,:]=grid_z[m][Nz-nz_end:Nz-nz_start,:]
-                        else:
-                            # Copy regular components + PML components
-                            send_r[5*m+0,:,:]=grid_r[m][Nz-nz_end:Nz-nz_start,:]
-                            send_r[5*m+1,:,:]=grid_t[m][Nz-nz_end:Nz-nz_start,:]
-                            send_r[5*m+2,:,:]=grid_z[m][Nz-nz_end:Nz-nz_start,:]
-                            send_r[5*m+3,:,:]=pml_r[m][Nz-nz_end:Nz-nz_start,:]
-                            send_r[5*m+4,:,:]=pml_t[m][Nz-nz_end:Nz-nz_start,:]
+                    send_r[...] = grids[:,:,Nz-nz_end:Nz-nz_start,:]
 
             elif after_receiving:
 
-                recv_l = self.recv_l[exchange_type]
-                recv_r = self.recv_r[exchange_type]
+                recv_l = self.recv_l[exchange_type].reshape( buffer_shape )
+                recv_r = self.recv_r[exchange_type].reshape( buffer_shape )
                 if method == 'replace':
                     # Replace the guard cells of the domain with the buffers
                     if copy_left:
-                        if pml_r is None:
-                            # Copy only the regular components
-                            for m in range(self.Nm):
-                                grid_r[m][:nz_end-nz_start,:]=recv_l[3*m+0,:,:]
-                                grid_t[m][:nz_end-nz_start,:]=recv_l[3*m+1,:,:]
-                                grid_z[m][:nz_end-nz_start,:]=recv_l[3*m+2,:,:]
-                        else:
-                            # Copy regular components + PML components
-                            for m in range(self.Nm):
-                                grid_r[m][:nz_end-nz_start,:]=recv_l[5*m+0,:,:]
-                                grid_t[m][:nz_end-nz_start,:]=recv_l[5*m+1,:,:]
-                                grid_z[m][:nz_end-nz_start,:]=recv_l[5*m+2,:,:]
-                                pml_r[m][:nz_end-nz_start,:]=recv_l[5*m+3,:,:]
-                                pml_t[m][:nz_end-nz_start,:]=recv_l[5*m+4,:,:]
+                        grids[:,:,:nz_span,:] = recv_l
                     if copy_right:
-                        for m in range(self.Nm):
-                            if pml_r is None:
-                                # Copy only the regular components
-                                grid_r[m][-(nz_end-nz_start):,:]=recv_r[3*m+0,:,:]
-                                grid_t[m][-(nz_end-nz_start):,:]=recv_r[3*m+1,:,:]
-                                grid_z[m][-(nz_end-nz_start):,:]=recv_r[3*m+2,:,:]
-                            else:
-                                # Copy regular components + PML components
-                                grid_r[m][-(nz_end-nz_start):,:]=recv_r[5*m+0,:,:]
-                                grid_t[m][-(nz_end-nz_start):,:]=recv_r[5*m+1,:,:]
-                                grid_z[m][-(nz_end-nz_start):,:]=recv_r[5*m+2,:,:]
-                                pml_r[m][-(nz_end-nz_start):,:]=recv_r[5*m+3,:,:]
-                                pml_t[m][-(nz_end-nz_start):,:]=recv_r[5*m+4,:,:]
+                        grids[:,:,-nz_span:,:] = recv_r
                 elif method == 'add':
                     # Add buffers to the domain
                     if copy_left:
-                        for m in range(self.Nm):
-                            grid_r[m][:nz_end-nz_start,:]+=recv_l[3*m+0,:,:]
-                            grid_t[m][:nz_end-nz_start,:]+=recv_l[3*m+1,:,:]
-                            grid_z[m][:nz_end-nz_start,:]+=recv_l[3*m+2,:,:]
+                        grids[:,:,:nz_span,:] += recv_l
                     if copy_right:
-                        for m in range(self.Nm):
-                            grid_r[m][-(nz_end-nz_start):,:]+=recv_r[3*m+0,:,:]
-                            grid_t[m][-(nz_end-nz_start):,:]+=recv_r[3*m+1,:,:]
-                            grid_z[m][-(nz_end-nz_start):,:]+=recv_r[3*m+2,:,:]
+                        grids[:,:,-nz_span:,:] += recv_r
 
 
     def handle_scal_buffer( self, grid, method, exchange_type, use_cuda,
@@ -376,9 +380,9 @@ class BufferHandler(object):
 
         Parameters
         ----------
-        grid: list of 2darrays
-            (One element per azimuthal mode)
-            The 2d arrays represent the fields on the interpolation grid
+        grid: 3darray
+            Array of shape (Nm, Nz, Nr), which represents the field on the
+            interpolation grid, for all modes
 
         method: str
             Can either be 'replace' or 'add' depending on the type
@@ -403,100 +407,8 @@ class BufferHandler(object):
               for computation. This involves a manual GPU to CPU memory
               copy before exchanging information between MPI domains.
         """
-        # Define region that is copied to or from the buffer
-        # depending on the method used.
-        if method == 'replace':
-            nz_start = self.n_guard
-            nz_end = 2*self.n_guard
-        if method == 'add':
-            nz_start = 0
-            nz_end = 2*self.n_guard
-        # Whether or not to send to the left or right neighbor
-        copy_left = (self.left_proc is not None)
-        copy_right = (self.right_proc is not None)
-        Nz = grid[0].shape[0]
-
-        # When using the GPU
-        if use_cuda:
-            # Calculate the number of blocks and threads per block
-            dim_grid_2d, dim_block_2d = cuda_tpb_bpg_2d(
-                nz_end - nz_start, self.Nr )
-
-            if before_sending:
-                # Copy the inner regions of the domain to the buffers
-                for m in range(self.Nm):
-                    copy_scal_to_gpu_buffer[ dim_grid_2d, dim_block_2d ](
-                        self.d_send_l[exchange_type],
-                        self.d_send_r[exchange_type],
-                        grid[m], m, copy_left, copy_right, nz_start, nz_end)
-                # If GPUDirect with CUDA-aware MPI is not used,
-                # copy the GPU buffers to the sending CPU buffers
-                if not gpudirect:
-                    if copy_left:
-                        self.d_send_l[exchange_type].get(
-                            out=self.send_l[exchange_type] )
-                    if copy_right:
-                        self.d_send_r[exchange_type].get(
-                            out=self.send_r[exchange_type] )
-
-            elif after_receiving:
-                # If GPUDirect with CUDA-aware MPI is not used,
-                # copy the CPU receiving buffers to the GPU buffers
-                if not gpudirect:
-                    if copy_left:
-                        self.d_recv_l[exchange_type].set(
-                            self.recv_l[exchange_type] )
-                    if copy_right:
-                        self.d_recv_r[exchange_type].set(
-                            self.recv_r[exchange_type] )
-                if method == 'replace':
-                    # Replace the guard cells of the domain with the buffers
-                    for m in range(self.Nm):
-                        replace_scal_from_gpu_buffer[dim_grid_2d, dim_block_2d](
-                            self.d_recv_l[exchange_type],
-                            self.d_recv_r[exchange_type],
-                            grid[m], m, copy_left, copy_right, nz_start, nz_end)
-                elif method == 'add':
-                    # Add the buffers to the domain
-                    for m in range(self.Nm):
-                        add_scal_from_gpu_buffer[ dim_grid_2d, dim_block_2d ](
-                            self.d_recv_l[exchange_type],
-                            self.d_recv_r[exchange_type],
-                            grid[m], m, copy_left, copy_right, nz_start, nz_end)
-
-        # Without GPU
-        else:
-
-            if before_sending:
-
-                send_l = self.send_l[exchange_type]
-                send_r = self.send_r[exchange_type]
-                # Copy the inner regions of the domain to the buffer
-                if copy_left:
-                    for m in range(self.Nm):
-                        send_l[m,:,:]=grid[m][nz_start:nz_end,:]
-                if copy_right:
-                    for m in range(self.Nm):
-                        send_r[m,:,:]=grid[m][Nz-nz_end:Nz-nz_start,:]
-
-            elif after_receiving:
-
-                recv_l = self.recv_l[exchange_type]
-                recv_r = self.recv_r[exchange_type]
-                if method == 'replace':
-                    # Replace the guard cells of the domain with the buffers
-                    if copy_left:
-                        for m in range(self.Nm):
-                            grid[m][:nz_end-nz_start,:]=recv_l[m,:,:]
-                    if copy_right:
-                        for m in range(self.Nm):
-                            grid[m][-(nz_end-nz_start):,:]=recv_r[m,:,:]
-
-                if method == 'add':
-                    # Add buffers to the domain
-                    if copy_left:
-                        for m in range(self.Nm):
-                            grid[m][:nz_end-nz_start,:]+=recv_l[m,:,:]
-                    if copy_right:
-                        for m in range(self.Nm):
-                            grid[m][-(nz_end-nz_start):,:]+=recv_r[m,:,:]
+        # Handle the scalar field as a vector field with a single component
+        Nm, Nz, Nr = grid.shape
+        self.handle_vec_buffer( grid.reshape( (Nm, 1, Nz, Nr) ), method,
+                exchange_type, use_cuda, before_sending=before_sending,
+                after_receiving=after_receiving, gpudirect=gpudirect )
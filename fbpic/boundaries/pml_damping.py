@@ -140,15 +140,20 @@ if cuda_installed:
                 damp_factor= damp_array[i_pml]
                 # Get the index in the bigger field array
                 ir = Nr - n_pml + i_pml
-                # Substract the theta PML fields to the regular theta fields
-                Et[iz,ir] -= Et_pml[iz,ir]
-                Bt[iz,ir] -= Bt_pml[iz,ir]
+                # Load the fields (each field is read and written only once)
+                et = Et[iz,ir]
+                et_pml = Et_pml[iz,ir]
+                bt = Bt[iz,ir]
+                bt_pml = Bt_pml[iz,ir]
                 # Damp the theta PML fields
-                Et_pml[iz,ir] *= damp_factor
-                Bt_pml[iz,ir] *= damp_factor
-                # Add the theta PML fields back to the regular theta fields
-                Et[iz,ir] += Et_pml[iz,ir]
-                Bt[iz,ir] += Bt_pml[iz,ir]
+                et_pml_damped = damp_factor*et_pml
+                bt_pml_damped = damp_factor*bt_pml
+                # Replace the theta PML fields by the damped ones, within
+                # the regular theta fields
+                Et[iz,ir] = (et - et_pml) + et_pml_damped
+                Bt[iz,ir] = (bt - bt_pml) + bt_pml_damped
+                Et_pml[iz,ir] = et_pml_damped
+                Bt_pml[iz,ir] = bt_pml_damped
                 # Damp the z fields
                 Ez[iz,ir] *= damp_factor
                 Bz[iz,ir] *= damp_factor
@@ -7,8 +7,10 @@ It defines the high-level Fields class.
 """
 import warnings
 import numpy as np
-from fbpic.utils.threading import nthreads
-from .numba_methods import sum_reduce_2d_array, numba_erase_threading_buffer
+from fbpic.utils.threading import nthreads, cpu_gather_precision, \
+    cpu_gather_layout
+from .numba_methods import sum_reduce_2d_array, \
+    numba_erase_threading_buffer, numba_copy_gather_fields
 from .utility_methods import get_modified_k
 from .spectral_transform import SpectralTransformer
 from .interpolation_grid import InterpolationGrid
@@ -16,6 +18,8 @@ from .spectral_grid import SpectralGrid
 from .psatd_coefs import PsatdCoeffs
 from fbpic.utils.cuda import cuda_installed
 from .smoothing import BinomialSmoother
+if cuda_installed:
+    import cupy
 
 class Fields(object) :
     """
@@ -39,6 +43,16 @@ class Fields(object) :
     with one element per azimuthal mode
     - interp : a list of InterpolationGrid objects
         Contains the field data on the interpolation grid
+    - EB_modes, J_modes, rho_modes : arrays
+        Contain the field data on the interpolation grid, for all modes
+        (the fields of the InterpolationGrid objects are views into them)
+    - EB_modes_gather : array or None
+        Copy of the components of E and B (of shape (Nm, 6, Nz, Nr)), from
+        which the particles gather the fields on CPU. It is only allocated
+        (by `update_gather_fields`) if FBPIC_CPU_GATHER_PRECISION is set to
+        `single` (single-precision copy) and/or FBPIC_CPU_GATHER_LAYOUT is set
+        to `interleaved` (copy in which the 6 components of each cell are
+        contiguous) ; None otherwise.
     - spect : a list of SpectralGrid objects
         Contains the field data on the spectral grid
     - trans : a list of SpectralTransformer objects
@@ -169,6 +183,19 @@ class Fields(object) :
                 use_pml=use_pml, use_cuda=self.use_cuda,
                 use_ruyten_shapes=use_ruyten_shapes,
                 use_modified_volume=use_modified_volume ) )
+        # Allocate the fields of all the modes as contiguous arrays
+        # (with the mode index as first axis), so that all the modes
+        # can be handled in one pass (e.g. by the MPI exchanges)
+        self.EB_modes = np.zeros( (Nm,) + self.interp[0].EB_stack.shape,
+                                  dtype='complex' )
+        self.J_modes = np.zeros( (Nm,) + self.interp[0].J_stack.shape,
+                                 dtype='complex' )
+        self.rho_modes = np.zeros( (Nm,) + self.interp[0].rho.shape,
+                                   dtype='complex' )
+        # The copy of E and B used by the field gathering (if requested)
+        # is only allocated when the fields are first gathered
+        self.EB_modes_gather = None
+        self.bind_interp_modes()
 
         # Get the kz and (finite-order) modified kz arrays
         # (According to FFT conventions, the kz array starts with
@@ -226,8 +253,11 @@ class Fields(object) :
         interpolation and spectral grids point to GPU arrays
         """
         if self.use_cuda:
+            self.EB_modes = cupy.asarray( self.EB_modes )
+            self.J_modes = cupy.asarray( self.J_modes )
+            self.rho_modes = cupy.asarray( self.rho_modes )
+            self.bind_interp_modes()
             for m in range(self.Nm) :
-                self.interp[m].send_fields_to_gpu()
                 self.spect[m].send_fields_to_gpu()
             self.data_is_on_gpu = True
 
@@ -239,11 +269,61 @@ class Fields(object) :
         interpolation and spectral grids are accessible by the CPU again.
         """
         if self.use_cuda:
+            self.EB_modes = self.EB_modes.get()
+            self.J_modes = self.J_modes.get()
+            self.rho_modes = self.rho_modes.get()
+            self.bind_interp_modes()
             for m in range(self.Nm) :
-                self.interp[m].receive_fields_from_gpu()
                 self.spect[m].receive_fields_from_gpu()
             self.data_is_on_gpu = False
 
+    def bind_interp_modes( self ):
+        """
+        Point the fields of the interpolation grid of each mode to the
+        corresponding mode of the arrays EB_modes, J_modes and rho_modes.
+        """
+        for m in range(self.Nm):
+            self.interp[m].bind_modes( self.EB_modes, self.J_modes,
+                                       self.rho_modes, m )
+            if self.EB_modes_gather is not None:
+                self.interp[m].E_gather_stack = self.EB_modes_gather[m, :3]
+                self.interp[m].B_gather_stack = self.EB_modes_gather[m, 3:]
+
+    def update_gather_fields( self ):
+        """
+        Copy E and B to the arrays from which the particles gather the
+        fields, when these are a separate copy (see `EB_modes_gather` ;
+        otherwise the particles gather directly from E and B).
+
+        This needs to be called whenever E and B have been modified on the
+        interpolation grid, before the field gathering.
+        """
+        # The copy is only used on CPU, if requested
+        if self.use_cuda or ( (cpu_gather_precision != 'single')
+                            and (cpu_gather_layout != 'interleaved') ):
+            return
+        # Allocate the copy at the first call (so that the Fields objects
+        # that are not used for the gathering do not allocate it)
+        if self.EB_modes_gather is None:
+            if cpu_gather_precision == 'single':
+                dtype = np.complex64
+            else:
+                dtype = np.complex128
+            Nz_grid, Nr_grid = self.interp[0].EB_stack.shape[1:]
+            if cpu_gather_layout == 'interleaved':
+                # Allocate with the components as last (contiguous) axis,
+                # but access it through a view of shape (Nm, 6, Nz, Nr)
+                EB_interleaved = np.zeros(
+                    (self.Nm, Nz_grid, Nr_grid, 6), dtype=dtype )
+                self.EB_modes_gather = EB_interleaved.transpose( 0, 3, 1, 2 )
+            else:
+                self.EB_modes_gather = np.zeros(
+                    (self.Nm, 6, Nz_grid, Nr_grid), dtype=dtype )
+            self.bind_interp_modes()
+
+        numba_copy_gather_fields( self.EB_modes, self.EB_modes_gather,
+            self.interp[0].n_fld, cpu_gather_layout == 'interleaved' )
+
     def push(self, use_true_rho=False, check_exchanges=False):
         """
         Push the different azimuthal modes over one timestep,
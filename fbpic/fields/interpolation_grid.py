@@ -25,6 +25,19 @@ class InterpolationGrid(object) :
     - z,r : 1darrays containing the positions of the grid
     - Er, Et, Ez, Br, Bt, Bz, Jr, Jt, Jz, rho :
       2darrays containing the fields.
+    - EB_stack, J_stack :
+      3darrays containing the stacked components of E and B
+      (and PML components, if any) and of J. (Er, ..., Jz are views
+      into these arrays.)
+    - EB_modes, J_modes, rho_modes :
+      arrays containing the fields of all the azimuthal modes (with the
+      mode index as first axis), of which EB_stack, J_stack and rho are
+      views. When the grid is part of a Fields object, these arrays are
+      shared by the grids of all the modes (see `bind_modes`).
+    - E_gather_stack, B_gather_stack :
+      3darrays from which the fields are gathered by the particles.
+      (Views into E_stack and B_stack by default ; the Fields object can
+      instead bind them to a single-precision copy, see `update_gather_fields`)
     """
 
     def __init__(self, Nz, Nr, m, zmin, zmax, rmax,
@@ -138,22 +151,21 @@ class InterpolationGrid(object) :
                                     (np.array([0.]), self.ruyten_cubic_coef) )
 
         # Allocate the fields arrays
-        self.Er = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Et = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Ez = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Br = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Bt = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Bz = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jr = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jt = np.zeros( (Nz, Nr), dtype='complex' )
-        self.Jz = np.zeros( (Nz, Nr), dtype='complex' )
-        self.rho = np.zeros( (Nz, Nr), dtype='complex' )
-        # Allocate the PML fields if needed
+        # The components of E and B (including the PML components, if any)
+        # are allocated as a single contiguous stack of shape (n_EB, Nz, Nr),
+        # so that they can be handled in one pass by the MPI exchanges.
+        # The individual arrays (e.g. self.Er) are views into this stack.
+        # (The grid is allocated with a single mode here ; the Fields object
+        # then binds the grids of all modes to common arrays, see `bind_modes`)
         if self.use_pml:
-            self.Er_pml = np.zeros( (Nz, Nr), dtype='complex' )
-            self.Et_pml = np.zeros( (Nz, Nr), dtype='complex' )
-            self.Br_pml = np.zeros( (Nz, Nr), dtype='complex' )
-            self.Bt_pml = np.zeros( (Nz, Nr), dtype='complex' )
+            n_fld = 5 # Er, Et, Ez, Er_pml, Et_pml
+        else:
+            n_fld = 3 # Er, Et, Ez
+        self.n_fld = n_fld
+        self.bind_modes(
+            np.zeros( (1, 2*n_fld, Nz, Nr), dtype='complex' ),
+            np.zeros( (1, 3, Nz, Nr), dtype='complex' ),
+            np.zeros( (1, Nz, Nr), dtype='complex' ), 0 )
 
         # Check whether the GPU should be used
         self.use_cuda = use_cuda
@@ -175,51 +187,55 @@ class InterpolationGrid(object) :
         """Returns the 1d array of r, when the user queries self.r"""
         return( self.rmin + (0.5+np.arange(self.Nr))*self.dr )
 
-    def send_fields_to_gpu( self ):
+    def bind_modes( self, EB_modes, J_modes, rho_modes, i_mode ):
         """
-        Copy the fields to the GPU.
+        Point the fields of this grid to the mode `i_mode` of the arrays
+        EB_modes, J_modes and rho_modes, which contain the fields of
+        all the azimuthal modes.
 
-        After this function is called, the array attributes
-        point to GPU arrays.
-        """
-        self.Er = cupy.asarray( self.Er )
-        self.Et = cupy.asarray( self.Et )
-        self.Ez = cupy.asarray( self.Ez )
-        self.Br = cupy.asarray( self.Br )
-        self.Bt = cupy.asarray( self.Bt )
-        self.Bz = cupy.asarray( self.Bz )
-        self.Jr = cupy.asarray( self.Jr )
-        self.Jt = cupy.asarray( self.Jt )
-        self.Jz = cupy.asarray( self.Jz )
-        self.rho = cupy.asarray( self.rho )
-        if self.use_pml:
-            self.Er_pml = cupy.asarray( self.Er_pml )
-            self.Et_pml = cupy.asarray( self.Et_pml )
-            self.Br_pml = cupy.asarray( self.Br_pml )
-            self.Bt_pml = cupy.asarray( self.Bt_pml )
+        This allows the fields of all the modes to be contiguous in memory
+        (and thus to be handled in one pass, e.g. by the MPI exchanges).
+
+        Parameters
+        ----------
+        EB_modes, J_modes: 4darrays of complexs
+            Arrays of shape (Nm, n_comp, Nz, Nr), which contain the stacked
+            components of E and B (resp. J), for all the modes
 
-    def receive_fields_from_gpu( self ):
+        rho_modes: 3darray of complexs
+            Array of shape (Nm, Nz, Nr), which contains rho for all the modes
+
+        i_mode: int
+            The index of the mode of this grid, in the above arrays
+        """
+        self.EB_modes = EB_modes
+        self.J_modes = J_modes
+        self.rho_modes = rho_modes
+        self.EB_stack = EB_modes[i_mode]
+        self.J_stack = J_modes[i_mode]
+        self.rho = rho_modes[i_mode]
+        self.bind_field_views()
+
+    def bind_field_views( self ):
         """
-        Receive the fields from the GPU.
+        Point the individual field attributes (e.g. self.Er, self.Jz)
+        to the corresponding components of the stacked arrays
+        `EB_stack` and `J_stack`.
 
-        After this function is called, the array attributes
-        are accessible by the CPU again.
+        This needs to be called whenever the stacked arrays are reallocated
+        (e.g. when they are transferred between CPU and GPU).
         """
-        self.Er = self.Er.get()
-        self.Et = self.Et.get()
-        self.Ez = self.Ez.get()
-        self.Br = self.Br.get()
-        self.Bt = self.Bt.get()
-        self.Bz = self.Bz.get()
-        self.Jr = self.Jr.get()
-        self.Jt = self.Jt.get()
-        self.Jz = self.Jz.get()
-        self.rho = self.rho.get()
+        n_fld = self.n_fld
+        self.E_stack = self.EB_stack[:n_fld]
+        self.B_stack = self.EB_stack[n_fld:]
+        self.Er, self.Et, self.Ez = self.E_stack[:3]
+        self.Br, self.Bt, self.Bz = self.B_stack[:3]
+        self.E_gather_stack = self.E_stack
+        self.B_gather_stack = self.B_stack
+        self.Jr, self.Jt, self.Jz = self.J_stack
         if self.use_pml:
-            self.Er_pml = self.Er_pml.get()
-            self.Et_pml = self.Et_pml.get()
-            self.Br_pml = self.Br_pml.get()
-            self.Bt_pml = self.Bt_pml.get()
+            self.Er_pml, self.Et_pml = self.E_stack[3:]
+            self.Br_pml, self.Bt_pml = self.B_stack[3:]
 
     def erase( self, fieldtype ):
         """
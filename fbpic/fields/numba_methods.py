@@ -386,6 +386,54 @@ def numba_push_eb_pml_comoving( Ep_pml, Em_pml, Bp_pml, Bm_pml,
 # Parallel reduction of the global arrays for threads into a single array
 # -----------------------------------------------------------------------
 
+@njit_parallel
+def numba_copy_gather_fields( EB_modes, EB_gather, n_fld, interleaved ):
+    """
+    Copy the components Er, Et, Ez, Br, Bt, Bz of all the modes from
+    `EB_modes` into `EB_gather`, from which the particles gather the fields.
+    (`EB_gather` can have a lower precision, and a different memory layout)
+
+    Parameters :
+    ------------
+    EB_modes : 4darray of complexs
+        The stacked components of E and B (including the PML components,
+        if any), of shape (Nm, 2*n_fld, Nz, Nr)
+
+    EB_gather : 4darray of complexs
+        An array of shape (Nm, 6, Nz, Nr), to which the fields are copied
+
+    n_fld : int
+        The number of components of E (or B) in EB_modes
+
+    interleaved : bool
+        Whether `EB_gather` is a view of an array of shape (Nm, Nz, Nr, 6),
+        i.e. whether the 6 components of each cell are contiguous in memory
+        (The loops are ordered so that the innermost loop writes
+        contiguous elements of `EB_gather`)
+    """
+    Nm = EB_gather.shape[0]
+    Nz = EB_gather.shape[2]
+    Nr = EB_gather.shape[3]
+    # Loop over the 2D grid (parallel in z, if threading is installed)
+    if interleaved:
+        for iz in prange(Nz):
+            for m in range(Nm):
+                for ir in range(Nr):
+                    for i in range(3):
+                        EB_gather[m, i, iz, ir] = EB_modes[m, i, iz, ir]
+                        EB_gather[m, 3+i, iz, ir] = \
+                            EB_modes[m, n_fld+i, iz, ir]
+    else:
+        for iz in prange(Nz):
+            for m in range(Nm):
+                for i in range(3):
+                    for ir in range(Nr):
+                        EB_gather[m, i, iz, ir] = EB_modes[m, i, iz, ir]
+                    for ir in range(Nr):
+                        EB_gather[m, 3+i, iz, ir] = \
+                            EB_modes[m, n_fld+i, iz, ir]
+
+
 @njit_parallel
 def numba_erase_threading_buffer( global_array ):
     """
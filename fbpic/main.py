@@ -404,8 +404,7 @@ class Simulation(object):
         # Get the E and B fields in spectral space initially
         # (In the rest of the loop, E and B will only be transformed
         # from spectal space to real space, but never the other way around)
-        self.comm.exchange_fields(fld.interp, 'E', 'replace')
-        self.comm.exchange_fields(fld.interp, 'B', 'replace')
+        self.comm.exchange_fields(fld.interp, 'EB', 'replace')
         self.comm.damp_EB_open_boundary( fld.interp )
         fld.interp2spect('E')
         fld.interp2spect('B')
@@ -465,6 +464,8 @@ class Simulation(object):
                 species.keep_fields_sorted = True
 
             # Gather the fields from the grid at t = n dt
+            # (If requested, first copy E and B to single precision)
+            fld.update_gather_fields()
             for species in ptcl:
                 species.gather( fld.interp, self.comm )
             # Apply the external fields at t = n dt
@@ -740,8 +741,7 @@ class Simulation(object):
             fld.spect2partial_interp('B')
 
         # - Exchange guard cells and damp fields
-        self.comm.exchange_fields(fld.interp, 'E', 'replace')
-        self.comm.exchange_fields(fld.interp, 'B', 'replace')
+        self.comm.exchange_fields(fld.interp, 'EB', 'replace')
         self.comm.damp_EB_open_boundary( fld.interp ) # Damp along z
         if self.use_pml:
             self.comm.damp_pml_EB( fld.interp ) # Damp in radial PML
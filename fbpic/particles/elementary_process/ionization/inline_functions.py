@@ -73,6 +73,11 @@ def copy_ionized_electrons_batch(
     should be copied, the cumulated number of electrons `cumulative_n_ionized`
     (one element per batch) is used.
     """
+    # Skip the batch if it does not create any electron (for this level)
+    # (avoids reading the flags `ionized_from` of all its ions)
+    if cumulative_n_ionized[i_level, i_batch+1] == \
+            cumulative_n_ionized[i_level, i_batch]:
+        return
     # Electron index: this is incremented each time
     # an ionized electron is identified
     elec_index = elec_old_Ntot + cumulative_n_ionized[i_level, i_batch]
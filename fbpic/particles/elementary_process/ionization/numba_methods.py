@@ -6,19 +6,30 @@ This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
 It defines numba methods that are used in particle ionization.
 
 Apart from synthactic, this file is very close to cuda_methods.py
+(except that `ionize_ions_numba` flags the ionized particles in a separate,
+per-particle loop, before counting them in each batch).
+
+The ionization is performed in two kernels: `ionize_ions_numba` flags
+and counts the ionized ions, and `copy_ionized_electrons_numba` creates
+the corresponding electrons. These kernels cannot be fused into a single
+pass, since the electron arrays need to be reallocated in between (with
+the total number of new electrons). The copy does not re-read the ion
+arrays in full: it only reads the flags, and the data of the ionized ions.
 """
-import numba
+from numba import int64
 from scipy.constants import c
-from fbpic.utils.threading import njit_parallel, prange
+from fbpic.utils.threading import njit_parallel_fastmath, njit_fastmath, \
+    prange
 # Import inline functions
 from .inline_functions import get_ionization_probability, \
     get_E_amplitude, copy_ionized_electrons_batch
 # Compile the inline functions for CPU
-get_ionization_probability = numba.njit(get_ionization_probability)
-get_E_amplitude = numba.njit(get_E_amplitude)
-copy_ionized_electrons_batch = numba.njit(copy_ionized_electrons_batch)
+# (with the same fast-math options as the ionization kernels)
+get_ionization_probability = njit_fastmath(get_ionization_probability)
+get_E_amplitude = njit_fastmath(get_E_amplitude)
+copy_ionized_electrons_batch = njit_fastmath(copy_ionized_electrons_batch)
 
-@njit_parallel
+@njit_parallel_fastmath
 def ionize_ions_numba( N_batch, batch_size, Ntot,
     level_start, level_max, n_levels,
     n_ionized, ionized_from, ionization_level, random_draw,
@@ -39,7 +50,32 @@ def ionize_ions_numba( N_batch, batch_size, Ntot,
     to be distinguished) counts the total number of ionized particles
     in the current batch.
     """
-    # Loop over batches of particles (in parallel, if threading is enabled)
+    # First pass: determine which ions are ionized
+    # (Parallel loop over the particles, independently of the batches:
+    # the loop body has no data-dependent work, so that it can be
+    # vectorized by the compiler)
+    for ip in prange( Ntot ):
+        level = int64( ionization_level[ip] )
+        # Use the ADK parameters of the current level (or of the last
+        # ionizable level, for ions that have reached the maximal level,
+        # which are excluded below)
+        i_adk = min( level, level_max-1 )
+        # Calculate the amplitude of the electric field,
+        # in the frame of the electrons (device inline function)
+        E, gamma = get_E_amplitude( ux[ip], uy[ip], uz[ip],
+                Ex[ip], Ey[ip], Ez[ip], c*Bx[ip], c*By[ip], c*Bz[ip] )
+        # Get ADK rate (device inline function)
+        p = get_ionization_probability( E, gamma,
+            adk_prefactor[i_adk], adk_power[i_adk], adk_exp_prefactor[i_adk])
+        # Set the flag: level before ionization, or -1 if not ionized
+        if (level < level_max) and (random_draw[ip] < p):
+            ionized_from[ip] = level-level_start
+        else:
+            ionized_from[ip] = -1
+
+    # Second pass: count the ionized particles in each batch, and update
+    # their ionization level and weight
+    # (parallel loop over batches, if threading is enabled)
     for i_batch in prange( N_batch ):
 
         # Set the count of ionized particles in the batch to 0
@@ -49,40 +85,22 @@ def ionize_ions_numba( N_batch, batch_size, Ntot,
         # Loop through the batch
         N_max = min( (i_batch+1)*batch_size, Ntot )
         for ip in range(i_batch*batch_size, N_max):
-
-            # Skip the ionization routine, if the maximal ionization level
-            # has already been reached for this macroparticle
-            level = ionization_level[ip]
-            if level >= level_max:
-                ionized_from[ip] = -1
-            else:
-                # Calculate the amplitude of the electric field,
-                # in the frame of the electrons (device inline function)
-                E, gamma = get_E_amplitude( ux[ip], uy[ip], uz[ip],
-                        Ex[ip], Ey[ip], Ez[ip], c*Bx[ip], c*By[ip], c*Bz[ip] )
-                # Get ADK rate (device inline function)
-                p = get_ionization_probability( E, gamma,
-                  adk_prefactor[level], adk_power[level], adk_exp_prefactor[level])
-                # Ionize particles
-                if random_draw[ip] < p:
-                    # Set the corresponding flag and update particle count
-                    ionized_from[ip] = level-level_start
-                    if n_levels == 1:
-                        # No need to distinguish ionization levels
-                        n_ionized[0, i_batch] += 1
-                    else:
-                        # Distinguish count for each ionizable level
-                        n_ionized[level-level_start, i_batch] += 1
-                    # Update the ionization level and the corresponding weight
-                    ionization_level[ip] += 1
-                    w_times_level[ip] = w[ip] * ionization_level[ip]
+            if ionized_from[ip] >= 0:
+                # Update particle count
+                if n_levels == 1:
+                    # No need to distinguish ionization levels
+                    n_ionized[0, i_batch] += 1
                 else:
-                    ionized_from[ip] = -1
+                    # Distinguish count for each ionizable level
+                    n_ionized[ionized_from[ip], i_batch] += 1
+                # Update the ionization level and the corresponding weight
+                ionization_level[ip] += 1
+                w_times_level[ip] = w[ip] * ionization_level[ip]
 
     return( n_ionized, ionized_from, ionization_level, w_times_level )
 
 
-@njit_parallel
+@njit_parallel_fastmath
 def copy_ionized_electrons_numba(
     N_batch, batch_size, elec_old_Ntot, ion_Ntot,
     cumulative_n_ionized, ionized_from,
@@ -6,17 +6,18 @@ This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
 It defines the field gathering methods linear and cubic order shapes
 on the GPU using CUDA, for one azimuthal mode at a time
 """
-from numba import cuda, float64, int64
+from numba import cuda, int64
 from fbpic.utils.cuda import compile_cupy
 import math
 # Import inline functions
-from .inline_functions import \
-    add_linear_gather_for_mode, add_cubic_gather_for_mode
+from .inline_functions import get_r_cos_sin, \
+    add_linear_gather_EB_for_mode, add_cubic_gather_EB_for_mode
 # Compile the inline functions for GPU
-add_linear_gather_for_mode = cuda.jit( add_linear_gather_for_mode,
-                                        device=True, inline=True )
-add_cubic_gather_for_mode = cuda.jit( add_cubic_gather_for_mode,
-                                        device=True, inline=True )
+get_r_cos_sin = cuda.jit( get_r_cos_sin, device=True, inline=True )
+add_linear_gather_EB_for_mode = cuda.jit( add_linear_gather_EB_for_mode,
+                                          device=True, inline=True )
+add_cubic_gather_EB_for_mode = cuda.jit( add_cubic_gather_EB_for_mode,
+                                         device=True, inline=True )
 
 @compile_cupy
 def erase_eb_cuda( Ex, Ey, Ez, Bx, By, Bz, Ntot ):
@@ -47,8 +48,7 @@ def gather_field_gpu_linear_one_mode(x, y, z,
                     rmax_gather,
                     invdz, zmin, Nz,
                     invdr, rmin, Nr,
-                    Er_m, Et_m, Ez_m,
-                    Br_m, Bt_m, Bz_m, m,
+                    E_m, B_m, m,
                     Ex, Ey, Ez,
                     Bx, By, Bz):
     """
@@ -77,11 +77,13 @@ def gather_field_gpu_linear_one_mode(x, y, z,
     Nz, Nr : int
         Number of gridpoints along the considered direction
 
-    Er_m, Et_m, Ez_m : 2darray of complexs
-        The electric fields on the interpolation grid for the mode m
+    E_m : 3darray of complexs
+        The stacked components of the electric field (Er, Et, Ez along
+        the first axis) on the interpolation grid for the mode m
 
-    Br_m, Bt_m, Bz_m : 2darray of complexs
-        The magnetic fields on the interpolation grid for the mode m
+    B_m : 3darray of complexs
+        The stacked components of the magnetic field (Br, Bt, Bz along
+        the first axis) on the interpolation grid for the mode m
 
     m: int
         Index of the azimuthal mode
@@ -107,14 +109,7 @@ def gather_field_gpu_linear_one_mode(x, y, z,
         zj = z[i]
 
         # Cylindrical conversion
-        rj = math.sqrt( xj**2 + yj**2 )
-        if (rj !=0. ) :
-            invr = 1./rj
-            cos = xj*invr  # Cosine
-            sin = yj*invr  # Sine
-        else :
-            cos = 1.
-            sin = 0.
+        rj, cos, sin = get_r_cos_sin( xj, yj )
         # Calculate azimuthal complex factor
         exptheta_m = 1.
         for _ in range(m):
@@ -174,39 +169,27 @@ def gather_field_gpu_linear_one_mode(x, y, z,
             S_lg = Sz_lower*Sr_guard
             S_ug = Sz_upper*Sr_guard
 
-            # E-Field
-            # -------
-            Fr = 0.
-            Ft = 0.
-            Fz = 0.
+            # E and B fields, in cylindrical coordinates
+            # ------------------------------------------
+            Er = 0.
+            Et = 0.
+            Ez_cyl = 0.
+            Br = 0.
+            Bt = 0.
+            Bz_cyl = 0.
             # Add contribution from mode m
-            Fr, Ft, Fz = add_linear_gather_for_mode( m,
-                Fr, Ft, Fz, exptheta_m, Er_m, Et_m, Ez_m,
+            Er, Et, Ez_cyl, Br, Bt, Bz_cyl = add_linear_gather_EB_for_mode( m,
+                Er, Et, Ez_cyl, Br, Bt, Bz_cyl, exptheta_m, E_m, B_m,
                 iz_lower, iz_upper, ir_lower, ir_upper,
                 S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
             # Convert to Cartesian coordinates
             # and write to particle field arrays
-            Ex[i] += cos*Fr - sin*Ft
-            Ey[i] += sin*Fr + cos*Ft
-            Ez[i] += Fz
-
-            # B-Field
-            # -------
-            # Clear the placeholders for the
-            # gathered field for each coordinate
-            Fr = 0.
-            Ft = 0.
-            Fz = 0.
-            # Add contribution from mode m
-            Fr, Ft, Fz = add_linear_gather_for_mode( m,
-                Fr, Ft, Fz, exptheta_m, Br_m, Bt_m, Bz_m,
-                iz_lower, iz_upper, ir_lower, ir_upper,
-                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
-            # Convert to Cartesian coordinates
-            # and write to particle field arrays
-            Bx[i] += cos*Fr - sin*Ft
-            By[i] += sin*Fr + cos*Ft
-            Bz[i] += Fz
+            Ex[i] += cos*Er - sin*Et
+            Ey[i] += sin*Er + cos*Et
+            Ez[i] += Ez_cyl
+            Bx[i] += cos*Br - sin*Bt
+            By[i] += sin*Br + cos*Bt
+            Bz[i] += Bz_cyl
 
 # -----------------------
 # Field gathering cubic
@@ -217,8 +200,7 @@ def gather_field_gpu_cubic_one_mode(x, y, z,
                     rmax_gather,
                     invdz, zmin, Nz,
                     invdr, rmin, Nr,
-                    Er_m, Et_m, Ez_m,
-                    Br_m, Bt_m, Bz_m, m,
+                    E_m, B_m, m,
                     Ex, Ey, Ez,
                     Bx, By, Bz):
     """
@@ -247,11 +229,13 @@ def gather_field_gpu_cubic_one_mode(x, y, z,
     Nz, Nr : int
         Number of gridpoints along the considered direction
 
-    Er_m, Et_m, Ez_m : 2darray of complexs
-        The electric fields on the interpolation grid for the mode m
+    E_m : 3darray of complexs
+        The stacked components of the electric field (Er, Et, Ez along
+        the first axis) on the interpolation grid for the mode m
 
-    Br_m, Bt_m, Bz_m : 2darray of complexs
-        The magnetic fields on the interpolation grid for the mode m
+    B_m : 3darray of complexs
+        The stacked components of the magnetic field (Br, Bt, Bz along
+        the first axis) on the interpolation grid for the mode m
 
     m: int
         Index of the azimuthal mode
@@ -278,14 +262,7 @@ def gather_field_gpu_cubic_one_mode(x, y, z,
         zj = z[i]
 
         # Cylindrical conversion
-        rj = math.sqrt(xj**2 + yj**2)
-        if (rj != 0.):
-            invr = 1./rj
-            cos = xj*invr  # Cosine
-            sin = yj*invr  # Sine
-        else:
-            cos = 1.
-            sin = 0.
+        rj, cos, sin = get_r_cos_sin( xj, yj )
         # Calculate azimuthal complex factor
         exptheta_m = 1.
         for _ in range(m):
@@ -301,49 +278,38 @@ def gather_field_gpu_cubic_one_mode(x, y, z,
         if rj < rmax_gather:
 
             # Calculate the shape factors
-            Sr = cuda.local.array((4,), dtype=float64)
+            # (stored in tuples rather than local arrays, so that they
+            # can be kept in registers)
             ir_lowest = int64(math.floor(r_cell)) - 1
             r_local = r_cell-ir_lowest
-            Sr[0] = -1./6. * (r_local-2.)**3
-            Sr[1] = 1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.)
-            Sr[2] = 1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.)
-            Sr[3] = -1./6. * (1.-r_local)**3
-            Sz = cuda.local.array((4,), dtype=float64)
+            Sr = ( -1./6. * (r_local-2.)**3,
+                1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.),
+                1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.),
+                -1./6. * (1.-r_local)**3 )
             iz_lowest = int64(math.floor(z_cell)) - 1
             z_local = z_cell-iz_lowest
-            Sz[0] = -1./6. * (z_local-2.)**3
-            Sz[1] = 1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.)
-            Sz[2] = 1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.)
-            Sz[3] = -1./6. * (1.-z_local)**3
-
-            # E-Field
-            # -------
-            Fr = 0.
-            Ft = 0.
-            Fz = 0.
-            # Add contribution from mode m
-            Fr, Ft, Fz = add_cubic_gather_for_mode( m,
-                Fr, Ft, Fz, exptheta_m, Er_m, Et_m, Ez_m,
-                ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
-            # Convert to Cartesian coordinates
-            # and write to particle field arrays
-            Ex[i] += cos*Fr - sin*Ft
-            Ey[i] += sin*Fr + cos*Ft
-            Ez[i] += Fz
-
-            # B-Field
-            # -------
-            # Clear the placeholders for the
-            # gathered field for each coordinate
-            Fr = 0.
-            Ft = 0.
-            Fz = 0.
+            Sz = ( -1./6. * (z_local-2.)**3,
+                1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.),
+                1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.),
+                -1./6. * (1.-z_local)**3 )
+
+            # E and B fields, in cylindrical coordinates
+            # ------------------------------------------
+            Er = 0.
+            Et = 0.
+            Ez_cyl = 0.
+            Br = 0.
+            Bt = 0.
+            Bz_cyl = 0.
             # Add contribution from mode m
-            Fr, Ft, Fz =  add_cubic_gather_for_mode( m,
-                Fr, Ft, Fz, exptheta_m, Br_m, Bt_m, Bz_m,
+            Er, Et, Ez_cyl, Br, Bt, Bz_cyl = add_cubic_gather_EB_for_mode( m,
+                Er, Et, Ez_cyl, Br, Bt, Bz_cyl, exptheta_m, E_m, B_m,
                 ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
             # Convert to Cartesian coordinates
             # and write to particle field arrays
-            Bx[i] += cos*Fr - sin*Ft
-            By[i] += sin*Fr + cos*Ft
-            Bz[i] += Fz
+            Ex[i] += cos*Er - sin*Et
+            Ey[i] += sin*Er + cos*Et
+            Ez[i] += Ez_cyl
+            Bx[i] += cos*Br - sin*Bt
+            By[i] += sin*Br + cos*Bt
+            Bz[i] += Bz_cyl
@@ -6,33 +6,62 @@ This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
 It defines inline functions that are compiled for both GPU and CPU, and
 used in the gathering kernels.
 """
-def add_linear_gather_for_mode( m,
-    Fr, Ft, Fz, exptheta_m, Fr_grid, Ft_grid, Fz_grid,
+import math
+
+def get_r_cos_sin( x, y ):
+    """
+    Return the radial position of a macroparticle, and the cosine and sine
+    of its azimuthal angle, from its transverse position `x`, `y`.
+
+    The radius is obtained as r**2 * (1/r), so that the computation only
+    involves one reciprocal square root (which can be lowered to a fast
+    `rsqrt` instruction with fast-math), instead of a square root followed
+    by a division.
+    For a macroparticle on the axis, the cosine is 1 and the sine is 0.
+
+    (These quantities are recomputed by each kernel, rather than stored in
+    per-particle arrays: storing them would add 24 bytes of memory traffic
+    per particle to kernels that are limited by memory bandwidth, in order
+    to save a single reciprocal square root.)
+    """
+    r2 = x*x + y*y
+    if r2 != 0.:
+        invr = 1./math.sqrt( r2 )
+        return( r2*invr, x*invr, y*invr )
+    else:
+        return( 0., 1., 0. )
+
+def add_linear_gather_EB_for_mode( m,
+    Er, Et, Ez, Br, Bt, Bz, exptheta_m, E_grid, B_grid,
     iz_lower, iz_upper, ir_lower, ir_upper,
     S_ll, S_lu, S_lg, S_ul, S_uu, S_ug ):
     """
-    Add the contribution of the gathered field from azimuthal mode `m` to the
-    fields felt by one macroparticle (`Fr`, `Ft`, `Fz`), using linear weights.
+    Add the contribution of the gathered fields from azimuthal mode `m` to the
+    fields felt by one macroparticle (`Er`, ..., `Bz`), using linear weights.
+
+    E and B are gathered in the same pass over the grid cells, so that the
+    indices and weights of the macroparticle are only used once per cell.
 
     Parameters:
     -----------
     m: int
         The index of the azimuthal mode that is added.
 
-    Fr, Ft, Fz: floats
-        The fields felt by one macroparticle, which represent either E or B
+    Er, Et, Ez, Br, Bt, Bz: floats
+        The fields felt by one macroparticle
         (before the contribution of mode `m` has been added)
 
     exptheta_m: complex
         The complex azimuthal factor $e^{-i m \theta}$ where $\theta$ is
         the azimuthal position of the macroparticle considered.
 
-    Fr_grid, Ft_grid, Fz_grid: 2darrays of complexs
-        The fields on the interpolation grid for mode `m`
+    E_grid, B_grid: 3darrays of complexs
+        The stacked components of E and B (r, t, z along the first axis)
+        on the interpolation grid for mode `m`
 
     iz_lower, iz_upper, ir_lower, ir_upper: ints
         Lower and upper index in z and r from which the macroparticle
-        considered should gather the fields (in the arrays F*_grid)
+        considered should gather the fields (in the arrays E_grid, B_grid)
 
     S_ll, S_lu, S_lg, S_ul, S_uu, S_ug: floats
         The weights with which the fields are gathered, for the macroparticle
@@ -41,103 +70,144 @@ def add_linear_gather_for_mode( m,
 
     Returns:
     --------
-    Fr, Ft, Fz: floats
-        The fields felt by one macroparticle, which represent either E or B
+    Er, Et, Ez, Br, Bt, Bz: floats
+        The fields felt by one macroparticle
         (after the contribution of mode `m` has been added)
     """
     # Create temporary variables
     # for the "per mode" gathering
-    Fr_m = 0.j
-    Ft_m = 0.j
-    Fz_m = 0.j
+    Er_m = 0.j
+    Et_m = 0.j
+    Ez_m = 0.j
+    Br_m = 0.j
+    Bt_m = 0.j
+    Bz_m = 0.j
     # Lower cell in z, Lower cell in r
-    Fr_m += S_ll * Fr_grid[ iz_lower, ir_lower ]
-    Ft_m += S_ll * Ft_grid[ iz_lower, ir_lower ]
-    Fz_m += S_ll * Fz_grid[ iz_lower, ir_lower ]
+    Er_m += S_ll * E_grid[ 0, iz_lower, ir_lower ]
+    Et_m += S_ll * E_grid[ 1, iz_lower, ir_lower ]
+    Ez_m += S_ll * E_grid[ 2, iz_lower, ir_lower ]
+    Br_m += S_ll * B_grid[ 0, iz_lower, ir_lower ]
+    Bt_m += S_ll * B_grid[ 1, iz_lower, ir_lower ]
+    Bz_m += S_ll * B_grid[ 2, iz_lower, ir_lower ]
     # Lower cell in z, Upper cell in r
-    Fr_m += S_lu * Fr_grid[ iz_lower, ir_upper ]
-    Ft_m += S_lu * Ft_grid[ iz_lower, ir_upper ]
-    Fz_m += S_lu * Fz_grid[ iz_lower, ir_upper ]
+    Er_m += S_lu * E_grid[ 0, iz_lower, ir_upper ]
+    Et_m += S_lu * E_grid[ 1, iz_lower, ir_upper ]
+    Ez_m += S_lu * E_grid[ 2, iz_lower, ir_upper ]
+    Br_m += S_lu * B_grid[ 0, iz_lower, ir_upper ]
+    Bt_m += S_lu * B_grid[ 1, iz_lower, ir_upper ]
+    Bz_m += S_lu * B_grid[ 2, iz_lower, ir_upper ]
     # Upper cell in z, Lower cell in r
-    Fr_m += S_ul * Fr_grid[ iz_upper, ir_lower ]
-    Ft_m += S_ul * Ft_grid[ iz_upper, ir_lower ]
-    Fz_m += S_ul * Fz_grid[ iz_upper, ir_lower ]
+    Er_m += S_ul * E_grid[ 0, iz_upper, ir_lower ]
+    Et_m += S_ul * E_grid[ 1, iz_upper, ir_lower ]
+    Ez_m += S_ul * E_grid[ 2, iz_upper, ir_lower ]
+    Br_m += S_ul * B_grid[ 0, iz_upper, ir_lower ]
+    Bt_m += S_ul * B_grid[ 1, iz_upper, ir_lower ]
+    Bz_m += S_ul * B_grid[ 2, iz_upper, ir_lower ]
     # Upper cell in z, Upper cell in r
-    Fr_m += S_uu * Fr_grid[ iz_upper, ir_upper ]
-    Ft_m += S_uu * Ft_grid[ iz_upper, ir_upper ]
-    Fz_m += S_uu * Fz_grid[ iz_upper, ir_upper ]
+    Er_m += S_uu * E_grid[ 0, iz_upper, ir_upper ]
+    Et_m += S_uu * E_grid[ 1, iz_upper, ir_upper ]
+    Ez_m += S_uu * E_grid[ 2, iz_upper, ir_upper ]
+    Br_m += S_uu * B_grid[ 0, iz_upper, ir_upper ]
+    Bt_m += S_uu * B_grid[ 1, iz_upper, ir_upper ]
+    Bz_m += S_uu * B_grid[ 2, iz_upper, ir_upper ]
     # Add the fields from the guard cells
     if ir_lower == ir_upper == 0:
         flip_factor = (-1.)**m
         # Lower cell in z
-        Fr_m += -flip_factor * S_lg * Fr_grid[ iz_lower, 0]
-        Ft_m += -flip_factor * S_lg * Ft_grid[ iz_lower, 0]
-        Fz_m +=  flip_factor * S_lg * Fz_grid[ iz_lower, 0]
+        Er_m += -flip_factor * S_lg * E_grid[ 0, iz_lower, 0]
+        Et_m += -flip_factor * S_lg * E_grid[ 1, iz_lower, 0]
+        Ez_m +=  flip_factor * S_lg * E_grid[ 2, iz_lower, 0]
+        Br_m += -flip_factor * S_lg * B_grid[ 0, iz_lower, 0]
+        Bt_m += -flip_factor * S_lg * B_grid[ 1, iz_lower, 0]
+        Bz_m +=  flip_factor * S_lg * B_grid[ 2, iz_lower, 0]
         # Upper cell in z
-        Fr_m += -flip_factor * S_ug * Fr_grid[ iz_upper, 0]
-        Ft_m += -flip_factor * S_ug * Ft_grid[ iz_upper, 0]
-        Fz_m +=  flip_factor * S_ug * Fz_grid[ iz_upper, 0]
-    # Add the contribution from mode m to Fr, Ft, Fz
+        Er_m += -flip_factor * S_ug * E_grid[ 0, iz_upper, 0]
+        Et_m += -flip_factor * S_ug * E_grid[ 1, iz_upper, 0]
+        Ez_m +=  flip_factor * S_ug * E_grid[ 2, iz_upper, 0]
+        Br_m += -flip_factor * S_ug * B_grid[ 0, iz_upper, 0]
+        Bt_m += -flip_factor * S_ug * B_grid[ 1, iz_upper, 0]
+        Bz_m +=  flip_factor * S_ug * B_grid[ 2, iz_upper, 0]
+    # Add the contribution from mode m to Er, ..., Bz
     # (Take into account factor 2 in the definition of azimuthal modes)
     if m == 0:
         factor = 1.
     else:
         factor = 2.
-    Fr += factor*(Fr_m*exptheta_m).real
-    Ft += factor*(Ft_m*exptheta_m).real
-    Fz += factor*(Fz_m*exptheta_m).real
+    # (Only the real part of the product with exptheta_m is needed: it is
+    # computed in real arithmetic, with the factor folded into exptheta_m)
+    exptheta_re = factor*exptheta_m.real
+    exptheta_im = factor*exptheta_m.imag
+    Er += Er_m.real*exptheta_re - Er_m.imag*exptheta_im
+    Et += Et_m.real*exptheta_re - Et_m.imag*exptheta_im
+    Ez += Ez_m.real*exptheta_re - Ez_m.imag*exptheta_im
+    Br += Br_m.real*exptheta_re - Br_m.imag*exptheta_im
+    Bt += Bt_m.real*exptheta_re - Bt_m.imag*exptheta_im
+    Bz += Bz_m.real*exptheta_re - Bz_m.imag*exptheta_im
 
-    return(Fr, Ft, Fz)
+    return(Er, Et, Ez, Br, Bt, Bz)
 
 
-def add_cubic_gather_for_mode( m,
-    Fr, Ft, Fz, exptheta_m, Fr_grid, Ft_grid, Fz_grid,
+def add_cubic_gather_EB_for_mode( m,
+    Er, Et, Ez, Br, Bt, Bz, exptheta_m, E_grid, B_grid,
     ir_lowest, iz_lowest, Sr_arr, Sz_arr, Nr, Nz ):
     """
-    Add the contribution of the gathered field from azimuthal mode `m` to the
-    fields felt by one macroparticle (`Fr`, `Ft`, `Fz`), using cubic weights.
+    Add the contribution of the gathered fields from azimuthal mode `m` to the
+    fields felt by one macroparticle (`Er`, ..., `Bz`), using cubic weights.
+
+    E and B are gathered in the same pass over the 4x4 grid cells, so that
+    the indices and weights of the macroparticle are only computed once
+    per cell.
 
     Parameters:
     -----------
     m: int
         The index of the azimuthal mode that is added.
 
-    Fr, Ft, Fz: floats
-        The fields felt by one macroparticle, which represent either E or B
+    Er, Et, Ez, Br, Bt, Bz: floats
+        The fields felt by one macroparticle
         (before the contribution of mode `m` has been added)
 
     exptheta_m: complex
         The complex azimuthal factor $e^{-i m \theta}$ where $\theta$ is
         the azimuthal position of the macroparticle considered.
 
-    Fr_grid, Ft_grid, Fz_grid: 2darrays of complexs
-        The fields on the interpolation grid for mode `m`
+    E_grid, B_grid: 3darrays of complexs
+        The stacked components of E and B (r, t, z along the first axis)
+        on the interpolation grid for mode `m`
 
     ir_lowest, iz_lowest: ints
         The lowest indices in r and z from which the macroparticle
-        considered should gather the fields (in the arrays F*_grid)
+        considered should gather the fields (in the arrays E_grid, B_grid)
         These indices can in fact be negative and out-of-bound
         (e.g. for particles close to the axis) but get corrected within
         this function.
 
-    Sr_arr, Sz_arr: 1darrays containing 4 floats
+    Sr_arr, Sz_arr: 1darrays (or tuples) containing 4 floats
         The weights in r and z with which the macroparticle
-        considered should gather the fields (in the arrays F*_grid)
+        considered should gather the fields (in the arrays E_grid, B_grid)
 
     Nr, Nz: ints
         Dimensions of the field arrays.
 
     Returns:
     --------
-    Fr, Ft, Fz: floats
-        The fields felt by one macroparticle, which represent either E or B
+    Er, Et, Ez, Br, Bt, Bz: floats
+        The fields felt by one macroparticle
         (after the contribution of mode `m` has been added)
     """
     # Create temporary variables
     # for the "per mode" gathering
-    Fr_m = 0.j
-    Ft_m = 0.j
-    Fz_m = 0.j
+    Er_m = 0.j
+    Et_m = 0.j
+    Ez_m = 0.j
+    Br_m = 0.j
+    Bt_m = 0.j
+    Bz_m = 0.j
+
+    # Sign of the fields below the axis, for the transverse
+    # and longitudinal components of the field
+    sign_long = (-1)**m
+    sign_perp = -sign_long
 
     # Loop over the 4x4 cells from which to gather fields
     for index_r in range(4):
@@ -149,8 +219,8 @@ def add_cubic_gather_for_mode( m,
         Sr_long = Sr_arr[ index_r ]
         Sr_perp = Sr_long
         if ir < 0:
-            Sr_long *= (-1)**m
-            Sr_perp *= -(-1)**m
+            Sr_long *= sign_long
+            Sr_perp *= sign_perp
         # Adjust radial index to avoid out of bound
         if ir < 0:
             ir = abs(ir) - 1
@@ -161,8 +231,9 @@ def add_cubic_gather_for_mode( m,
 
             # Longitudinal index
             iz = iz_lowest + index_z
-            # Get shape factor
-            Sz = Sz_arr[index_z]
+            # Get the shape factors (shared by E and B)
+            S_perp = Sz_arr[index_z]*Sr_perp
+            S_long = Sz_arr[index_z]*Sr_long
             # Adjust longitudinal index to avoid out of bound
             if iz < 0:
                 iz += Nz
@@ -170,18 +241,28 @@ def add_cubic_gather_for_mode( m,
                 iz -= Nz
 
             # Get the fields
-            Fr_m += Sz*Sr_perp*Fr_grid[iz, ir]
-            Ft_m += Sz*Sr_perp*Ft_grid[iz, ir]
-            Fz_m += Sz*Sr_long*Fz_grid[iz, ir]
+            Er_m += S_perp*E_grid[0, iz, ir]
+            Et_m += S_perp*E_grid[1, iz, ir]
+            Ez_m += S_long*E_grid[2, iz, ir]
+            Br_m += S_perp*B_grid[0, iz, ir]
+            Bt_m += S_perp*B_grid[1, iz, ir]
+            Bz_m += S_long*B_grid[2, iz, ir]
 
-    # Add the contribution from mode m to Fr, Ft, Fz
+    # Add the contribution from mode m to Er, ..., Bz
     # (Take into account factor 2 in the definition of azimuthal modes)
     if m == 0:
         factor = 1.
     else:
         factor = 2.
-    Fr += factor*(Fr_m*exptheta_m).real
-    Ft += factor*(Ft_m*exptheta_m).real
-    Fz += factor*(Fz_m*exptheta_m).real
+    # (Only the real part of the product with exptheta_m is needed: it is
+    # computed in real arithmetic, with the factor folded into exptheta_m)
+    exptheta_re = factor*exptheta_m.real
+    exptheta_im = factor*exptheta_m.imag
+    Er += Er_m.real*exptheta_re - Er_m.imag*exptheta_im
+    Et += Et_m.real*exptheta_re - Et_m.imag*exptheta_im
+    Ez += Ez_m.real*exptheta_re - Ez_m.imag*exptheta_im
+    Br += Br_m.real*exptheta_re - Br_m.imag*exptheta_im
+    Bt += Bt_m.real*exptheta_re - Bt_m.imag*exptheta_im
+    Bz += Bz_m.real*exptheta_re - Bz_m.imag*exptheta_im
 
-    return(Fr, Ft, Fz)
+    return(Er, Et, Ez, Br, Bt, Bz)
@@ -0,0 +1,320 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen, Kevin Peters
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the field gathering methods linear and cubic order shapes
+on the CPU with threading, for an arbitrary number of azimuthal modes
+(all the modes are gathered in the same pass over the particles)
+"""
+from numba import int64
+from fbpic.utils.threading import njit_parallel_fastmath, \
+    njit_fastmath, prange
+import math
+# Import inline functions
+from .inline_functions import get_r_cos_sin, \
+    add_linear_gather_EB_for_mode, add_cubic_gather_EB_for_mode
+# Compile the inline functions for CPU
+# (with the same fast-math options as the gathering kernels ; they are
+# inlined by Numba, so that the tuples of fields that they return are
+# kept in registers rather than packed and unpacked at each call)
+add_linear_gather_EB_for_mode = njit_fastmath( add_linear_gather_EB_for_mode )
+add_cubic_gather_EB_for_mode = njit_fastmath( add_cubic_gather_EB_for_mode )
+get_r_cos_sin = njit_fastmath( get_r_cos_sin )
+
+
+# -----------------------
+# Field gathering linear
+# -----------------------
+
+@njit_parallel_fastmath
+def gather_field_numba_linear_all_modes(x, y, z,
+                    rmax_gather,
+                    invdz, zmin, Nz,
+                    invdr, rmin, Nr,
+                    E_modes, B_modes,
+                    Ex, Ey, Ez,
+                    Bx, By, Bz,
+                    nthreads, ptcl_chunk_indices ):
+    """
+    Gathering of the fields (E and B) using numba with multi-threading.
+    Iterates over the particles, calculates the weighted amount
+    of fields acting on each particle based on its shape (linear).
+    Fields are gathered in cylindrical coordinates and then
+    transformed to cartesian coordinates.s
+
+    Parameters
+    ----------
+    x, y, z : 1darray of floats (in meters)
+        The position of the particles
+
+    rmax_gather: float (in meters)
+        The radius above which particle do not gather anymore
+
+    invdz, invdr : float (in meters^-1)
+        Inverse of the grid step along the considered direction
+
+    zmin, rmin : float (in meters)
+        Position of the edge of the simulation box along the
+        direction considered
+
+    Nz, Nr : int
+        Number of gridpoints along the considered direction
+
+    E_modes : tuple of 3darrays of complexs
+        The stacked components of the electric field (Er, Et, Ez along
+        the first axis) on the interpolation grid, for each mode
+
+    B_modes : tuple of 3darrays of complexs
+        The stacked components of the magnetic field (Br, Bt, Bz along
+        the first axis) on the interpolation grid, for each mode
+        (The number of modes is part of the type of these tuples, so that
+        a specialized kernel, with a fixed number of iterations of the loop
+        over the modes, is compiled for each number of modes)
+
+    Ex, Ey, Ez : 1darray of floats
+        The electric fields acting on the particles
+        (is modified by this function)
+
+    Bx, By, Bz : 1darray of floats
+        The magnetic fields acting on the particles
+        (is modified by this function)
+
+    nthreads : int
+        Number of CPU threads used with numba prange
+
+    ptcl_chunk_indices : array of int, of size nthreads+1
+        The indices (of the particle array) between which each thread
+        should loop. (i.e. divisions of particle array between threads)
+    """
+    # Gather the field per cell in parallel
+    for nt in prange( nthreads ):
+
+        # Loop over all particles in thread chunk
+        for i in range( ptcl_chunk_indices[nt],
+                            ptcl_chunk_indices[nt+1] ):
+            # Preliminary arrays for the cylindrical conversion
+            # --------------------------------------------
+            # Position
+            xj = x[i]
+            yj = y[i]
+            zj = z[i]
+
+            # Cylindrical conversion
+            rj, cos, sin = get_r_cos_sin( xj, yj )
+            exptheta_1 = cos - 1.j*sin
+
+            # Get linear weights for the deposition
+            # -------------------------------------
+            # Positions of the particles, in the cell unit
+            r_cell =  invdr*(rj - rmin) - 0.5
+            z_cell =  invdz*(zj - zmin) - 0.5
+
+            # E and B fields, in cylindrical coordinates
+            # ------------------------------------------
+            Er = 0.
+            Et = 0.
+            Ez_cyl = 0.
+            Br = 0.
+            Bt = 0.
+            Bz_cyl = 0.
+            # Only perform gathering for particles that are below rmax_gather
+            if rj < rmax_gather:
+
+                # Original index of the uppper and lower cell
+                ir_lower = int(math.floor( r_cell ))
+                ir_upper = ir_lower + 1
+                iz_lower = int(math.floor( z_cell ))
+                iz_upper = iz_lower + 1
+                # Linear weight
+                Sr_lower = ir_upper - r_cell
+                Sr_upper = r_cell - ir_lower
+                Sz_lower = iz_upper - z_cell
+                Sz_upper = z_cell - iz_lower
+                # Treat the boundary conditions
+                # -----------------------------
+                # (Without branches: the comparisons evaluate to 0 or 1, so that
+                # the control flow of the particle loop remains straight-line)
+                # guard cells in lower r: the weight of the lower cell is
+                # transferred to the guard weight
+                Sr_guard = Sr_lower * (ir_lower < 0)
+                Sr_lower -= Sr_guard
+                ir_lower = max( ir_lower, 0 )
+                # absorbing in upper r
+                ir_lower = min( ir_lower, Nr-1 )
+                ir_upper = min( ir_upper, Nr-1 )
+                # periodic boundaries in z
+                iz_lower += Nz*(iz_lower < 0) - Nz*(iz_lower > Nz-1)
+                iz_upper += Nz*(iz_upper < 0) - Nz*(iz_upper > Nz-1)
+
+                # Precalculate Shapes
+                S_ll = Sz_lower*Sr_lower
+                S_lu = Sz_lower*Sr_upper
+                S_ul = Sz_upper*Sr_lower
+                S_uu = Sz_upper*Sr_upper
+                S_lg = Sz_lower*Sr_guard
+                S_ug = Sz_upper*Sr_guard
+
+                # Add contribution from all the modes
+                # (exptheta_m = (cos - 1.j*sin)**m is obtained by repeated
+                # multiplication, from one mode to the next ; the number
+                # of modes is a compile-time constant, see docstring)
+                exptheta_m = 1. + 0.j
+                for m in range(len(E_modes)):
+                    Er, Et, Ez_cyl, Br, Bt, Bz_cyl = \
+                        add_linear_gather_EB_for_mode( m,
+                        Er, Et, Ez_cyl, Br, Bt, Bz_cyl, exptheta_m,
+                        E_modes[m], B_modes[m],
+                        iz_lower, iz_upper, ir_lower, ir_upper,
+                        S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
+                    exptheta_m *= exptheta_1
+
+            # Convert to Cartesian coordinates
+            # and write to particle field arrays
+            Ex[i] = cos*Er - sin*Et
+            Ey[i] = sin*Er + cos*Et
+            Ez[i] = Ez_cyl
+            Bx[i] = cos*Br - sin*Bt
+            By[i] = sin*Br + cos*Bt
+            Bz[i] = Bz_cyl
+
+    return Ex, Ey, Ez, Bx, By, Bz
+
+# -----------------------
+# Field gathering cubic
+# -----------------------
+
+@njit_parallel_fastmath
+def gather_field_numba_cubic_all_modes(x, y, z,
+                    rmax_gather,
+                    invdz, zmin, Nz,
+                    invdr, rmin, Nr,
+                    E_modes, B_modes,
+                    Ex, Ey, Ez,
+                    Bx, By, Bz,
+                    nthreads, ptcl_chunk_indices):
+    """
+    Gathering of the fields (E and B) using numba with multi-threading.
+    Iterates over the particles, calculates the weighted amount
+    of fields acting on each particle based on its shape (cubic).
+    Fields are gathered in cylindrical coordinates and then
+    transformed to cartesian coordinates.
+
+    Parameters
+    ----------
+    x, y, z : 1darray of floats (in meters)
+        The position of the particles
+
+    rmax_gather: float (in meters)
+        The radius above which particle do not gather anymore
+
+    invdz, invdr : float (in meters^-1)
+        Inverse of the grid step along the considered direction
+
+    zmin, rmin : float (in meters)
+        Position of the edge of the simulation box along the
+        direction considered
+
+    Nz, Nr : int
+        Number of gridpoints along the considered direction
+
+    E_modes : tuple of 3darrays of complexs
+        The stacked components of the electric field (Er, Et, Ez along
+        the first axis) on the interpolation grid, for each mode
+
+    B_modes : tuple of 3darrays of complexs
+        The stacked components of the magnetic field (Br, Bt, Bz along
+        the first axis) on the interpolation grid, for each mode
+        (The number of modes is part of the type of these tuples, so that
+        a specialized kernel, with a fixed number of iterations of the loop
+        over the modes, is compiled for each number of modes)
+
+    Ex, Ey, Ez : 1darray of floats
+        The electric fields acting on the particles
+        (is modified by this function)
+
+    Bx, By, Bz : 1darray of floats
+        The magnetic fields acting on the particles
+        (is modified by this function)
+
+    nthreads : int
+        Number of CPU threads used with numba prange
+
+    ptcl_chunk_indices : array of int, of size nthreads+1
+        The indices (of the particle array) between which each thread
+        should loop. (i.e. divisions of particle array between threads)
+    """
+    # Gather the field per cell in parallel
+    for nt in prange( nthreads ):
+
+        # Loop over all particles in thread chunk
+        for i in range( ptcl_chunk_indices[nt],
+                            ptcl_chunk_indices[nt+1] ):
+
+            # Preliminary arrays for the cylindrical conversion
+            # --------------------------------------------
+            # Position
+            xj = x[i]
+            yj = y[i]
+            zj = z[i]
+
+            # Cylindrical conversion
+            rj, cos, sin = get_r_cos_sin( xj, yj )
+            exptheta_1 = cos - 1.j*sin
+
+            # Get weights for the deposition
+            # --------------------------------------------
+            # Positions of the particle, in the cell unit
+            r_cell = invdr*(rj - rmin) - 0.5
+            z_cell = invdz*(zj - zmin) - 0.5
+
+            # E and B fields, in cylindrical coordinates
+            # ------------------------------------------
+            Er = 0.
+            Et = 0.
+            Ez_cyl = 0.
+            Br = 0.
+            Bt = 0.
+            Bz_cyl = 0.
+            # Only perform gathering for particles that are below rmax_gather
+            if rj < rmax_gather:
+
+                # Calculate the shape factors
+                # (stored in tuples rather than arrays, so that they
+                # can be kept in registers)
+                ir_lowest = int64(math.floor(r_cell)) - 1
+                r_local = r_cell-ir_lowest
+                Sr = ( -1./6. * (r_local-2.)**3,
+                    1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.),
+                    1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.),
+                    -1./6. * (1.-r_local)**3 )
+                iz_lowest = int64(math.floor(z_cell)) - 1
+                z_local = z_cell-iz_lowest
+                Sz = ( -1./6. * (z_local-2.)**3,
+                    1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.),
+                    1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.),
+                    -1./6. * (1.-z_local)**3 )
+
+                # Add contribution from all the modes
+                # (exptheta_m = (cos - 1.j*sin)**m is obtained by repeated
+                # multiplication, from one mode to the next ; the number
+                # of modes is a compile-time constant, see docstring)
+                exptheta_m = 1. + 0.j
+                for m in range(len(E_modes)):
+                    Er, Et, Ez_cyl, Br, Bt, Bz_cyl = \
+                        add_cubic_gather_EB_for_mode( m,
+                        Er, Et, Ez_cyl, Br, Bt, Bz_cyl, exptheta_m,
+                        E_modes[m], B_modes[m],
+                        ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
+                    exptheta_m *= exptheta_1
+
+            # Convert to Cartesian coordinates
+            # and write to particle field arrays
+            Ex[i] = cos*Er - sin*Et
+            Ey[i] = sin*Er + cos*Et
+            Ez[i] = Ez_cyl
+            Bx[i] = cos*Br - sin*Bt
+            By[i] = sin*Br + cos*Bt
+            Bz[i] = Bz_cyl
+
+    return Ex, Ey, Ez, Bx, By, Bz
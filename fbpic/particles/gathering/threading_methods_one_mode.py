@@ -3,20 +3,21 @@
 # License: 3-Clause-BSD-LBNL
 """
 This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
-It defines the field gathering methods linear and cubic order shapes
+It defines the field gathering method for the cubic order shape
 on the CPU with threading, for one azimuthal mode at a time
+(used when the particles are not sorted by cell: the working set of
+`gather_field_numba_cubic_all_modes` is then too large for the cache)
 """
-import numba
 from numba import int64
-from fbpic.utils.threading import njit_parallel, prange
+from fbpic.utils.threading import njit_parallel, njit_parallel_fastmath, \
+    njit_fastmath, prange
 import math
-import numpy as np
 # Import inline functions
-from .inline_functions import \
-    add_linear_gather_for_mode, add_cubic_gather_for_mode
+from .inline_functions import get_r_cos_sin, add_cubic_gather_EB_for_mode
 # Compile the inline functions for CPU
-add_linear_gather_for_mode = numba.njit( add_linear_gather_for_mode )
-add_cubic_gather_for_mode = numba.njit( add_cubic_gather_for_mode )
+# (with the same fast-math options as the gathering kernels)
+add_cubic_gather_EB_for_mode = njit_fastmath( add_cubic_gather_EB_for_mode )
+get_r_cos_sin = njit_fastmath( get_r_cos_sin )
 
 
 @njit_parallel
@@ -39,182 +40,16 @@ def erase_eb_numba( Ex, Ey, Ez, Bx, By, Bz, Ntot ):
         Bz[i] = 0
     return  Ex, Ey, Ez, Bx, By, Bz
 
-# -----------------------
-# Field gathering linear
-# -----------------------
-
-@njit_parallel
-def gather_field_numba_linear_one_mode(x, y, z,
-                    rmax_gather,
-                    invdz, zmin, Nz,
-                    invdr, rmin, Nr,
-                    Er_m, Et_m, Ez_m,
-                    Br_m, Bt_m, Bz_m, m,
-                    Ex, Ey, Ez,
-                    Bx, By, Bz ):
-    """
-    Gathering of the fields (E and B) using numba with multi-threading.
-    Iterates over the particles, calculates the weighted amount
-    of fields acting on each particle based on its shape (linear).
-    Fields are gathered in cylindrical coordinates and then
-    transformed to cartesian coordinates.s
-
-    Parameters
-    ----------
-    x, y, z : 1darray of floats (in meters)
-        The position of the particles
-
-    rmax_gather: float (in meters)
-        The radius above which particle do not gather anymore
-
-    invdz, invdr : float (in meters^-1)
-        Inverse of the grid step along the considered direction
-
-    zmin, rmin : float (in meters)
-        Position of the edge of the simulation box along the
-        direction considered
-
-    Nz, Nr : int
-        Number of gridpoints along the considered direction
-
-    Er_m, Et_m, Ez_m : 2darray of complexs
-        The electric fields on the interpolation grid for the mode m
-
-    Br_m, Bt_m, Bz_m : 2darray of complexs
-        The magnetic fields on the interpolation grid for the mode m
-
-    m: int
-        Index of the azimuthal mode
-
-    Ex, Ey, Ez : 1darray of floats
-        The electric fields acting on the particles
-        (is modified by this function)
-
-    Bx, By, Bz : 1darray of floats
-        The magnetic fields acting on the particles
-        (is modified by this function)
-    """
-    # Deposit the field per cell in parallel
-    for i in prange(x.shape[0]):
-        # Preliminary arrays for the cylindrical conversion
-        # --------------------------------------------
-        # Position
-        xj = x[i]
-        yj = y[i]
-        zj = z[i]
-
-        # Cylindrical conversion
-        rj = math.sqrt( xj**2 + yj**2 )
-        if (rj !=0. ) :
-            invr = 1./rj
-            cos = xj*invr  # Cosine
-            sin = yj*invr  # Sine
-        else :
-            cos = 1.
-            sin = 0.
-        exptheta_m = (cos - 1.j*sin)**m
-
-        # Get linear weights for the deposition
-        # -------------------------------------
-        # Positions of the particles, in the cell unit
-        r_cell =  invdr*(rj - rmin) - 0.5
-        z_cell =  invdz*(zj - zmin) - 0.5
-
-        # Only perform gathering for particles that are below rmax_gather
-        if rj < rmax_gather:
-
-            # Original index of the uppper and lower cell
-            ir_lower = int(math.floor( r_cell ))
-            ir_upper = ir_lower + 1
-            iz_lower = int(math.floor( z_cell ))
-            iz_upper = iz_lower + 1
-            # Linear weight
-            Sr_lower = ir_upper - r_cell
-            Sr_upper = r_cell - ir_lower
-            Sz_lower = iz_upper - z_cell
-            Sz_upper = z_cell - iz_lower
-            # Set guard weights to zero
-            Sr_guard = 0.
-
-            # Treat the boundary conditions
-            # -----------------------------
-            # guard cells in lower r
-            if ir_lower < 0:
-                Sr_guard = Sr_lower
-                Sr_lower = 0.
-                ir_lower = 0
-            # absorbing in upper r
-            if ir_lower > Nr-1:
-                ir_lower = Nr-1
-            if ir_upper > Nr-1:
-                ir_upper = Nr-1
-            # periodic boundaries in z
-            # lower z boundaries
-            if iz_lower < 0:
-                iz_lower += Nz
-            if iz_upper < 0:
-                iz_upper += Nz
-            # upper z boundaries
-            if iz_lower > Nz-1:
-                iz_lower -= Nz
-            if iz_upper > Nz-1:
-                iz_upper -= Nz
-
-            # Precalculate Shapes
-            S_ll = Sz_lower*Sr_lower
-            S_lu = Sz_lower*Sr_upper
-            S_ul = Sz_upper*Sr_lower
-            S_uu = Sz_upper*Sr_upper
-            S_lg = Sz_lower*Sr_guard
-            S_ug = Sz_upper*Sr_guard
-
-            # E-Field
-            # -------
-            Fr = 0.
-            Ft = 0.
-            Fz = 0.
-            # Add contribution from mode m
-            Fr, Ft, Fz = add_linear_gather_for_mode( m,
-                Fr, Ft, Fz, exptheta_m, Er_m, Et_m, Ez_m,
-                iz_lower, iz_upper, ir_lower, ir_upper,
-                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
-            # Convert to Cartesian coordinates
-            # and write to particle field arrays
-            Ex[i] += cos*Fr - sin*Ft
-            Ey[i] += sin*Fr + cos*Ft
-            Ez[i] += Fz
-
-            # B-Field
-            # -------
-            # Clear the placeholders for the
-            # gathered field for each coordinate
-            Fr = 0.
-            Ft = 0.
-            Fz = 0.
-            # Add contribution from mode m
-            Fr, Ft, Fz = add_linear_gather_for_mode( m,
-                Fr, Ft, Fz, exptheta_m, Br_m, Bt_m, Bz_m,
-                iz_lower, iz_upper, ir_lower, ir_upper,
-                S_ll, S_lu, S_lg, S_ul, S_uu, S_ug )
-            # Convert to Cartesian coordinates
-            # and write to particle field arrays
-            Bx[i] += cos*Fr - sin*Ft
-            By[i] += sin*Fr + cos*Ft
-            Bz[i] += Fz
-
-    return Ex, Ey, Ez, Bx, By, Bz
-
 # -----------------------
 # Field gathering cubic
 # -----------------------
 
-@njit_parallel
+@njit_parallel_fastmath
 def gather_field_numba_cubic_one_mode(x, y, z,
                     rmax_gather,
                     invdz, zmin, Nz,
                     invdr, rmin, Nr,
-                    Er_m, Et_m, Ez_m,
-                    Br_m, Bt_m, Bz_m, m,
+                    E_m, B_m, m,
                     Ex, Ey, Ez,
                     Bx, By, Bz,
                     nthreads, ptcl_chunk_indices):
@@ -224,7 +59,7 @@ def gather_field_numba_cubic_one_mode(x, y, z,
     of fields acting on each particle based on its shape (cubic).
     Fields are gathered in cylindrical coordinates and then
     transformed to cartesian coordinates.
-    Supports only mode 0 and 1.
+    The contribution of the mode m is added to the fields of the particles.
 
     Parameters
     ----------
@@ -244,11 +79,13 @@ def gather_field_numba_cubic_one_mode(x, y, z,
     Nz, Nr : int
         Number of gridpoints along the considered direction
 
-    Er_m, Et_m, Ez_m : 2darray of complexs
-        The electric fields on the interpolation grid for the mode m
+    E_m : 3darray of complexs
+        The stacked components of the electric field (Er, Et, Ez along
+        the first axis) on the interpolation grid for the mode m
 
-    Br_m, Bt_m, Bz_m : 2darray of complexs
-        The magnetic fields on the interpolation grid for the mode m
+    B_m : 3darray of complexs
+        The stacked components of the magnetic field (Br, Bt, Bz along
+        the first axis) on the interpolation grid for the mode m
 
     m: int
         Index of the azimuthal mode
@@ -271,11 +108,6 @@ def gather_field_numba_cubic_one_mode(x, y, z,
     # Gather the field per cell in parallel
     for nt in prange( nthreads ):
 
-        # Create private arrays for each thread
-        # to store the particle index and shape
-        Sr = np.empty( 4 )
-        Sz = np.empty( 4 )
-
         # Loop over all particles in thread chunk
         for i in range( ptcl_chunk_indices[nt],
                             ptcl_chunk_indices[nt+1] ):
@@ -288,15 +120,13 @@ def gather_field_numba_cubic_one_mode(x, y, z,
             zj = z[i]
 
             # Cylindrical conversion
-            rj = math.sqrt(xj**2 + yj**2)
-            if (rj != 0.):
-                invr = 1./rj
-                cos = xj*invr  # Cosine
-                sin = yj*invr  # Sine
-            else:
-                cos = 1.
-                sin = 0.
-            exptheta_m = (cos - 1.j*sin)**m
+            rj, cos, sin = get_r_cos_sin( xj, yj )
+            # Compute exptheta_m = (cos - 1.j*sin)**m by repeated
+            # multiplication (cheaper than the generic complex power)
+            exptheta_1 = cos - 1.j*sin
+            exptheta_m = 1. + 0.j
+            for _ in range(m):
+                exptheta_m *= exptheta_1
 
             # Get weights for the deposition
             # --------------------------------------------
@@ -308,49 +138,40 @@ def gather_field_numba_cubic_one_mode(x, y, z,
             if rj < rmax_gather:
 
                 # Calculate the shape factors
+                # (stored in tuples rather than arrays, so that they
+                # can be kept in registers)
                 ir_lowest = int64(math.floor(r_cell)) - 1
                 r_local = r_cell-ir_lowest
-                Sr[0] = -1./6. * (r_local-2.)**3
-                Sr[1] = 1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.)
-                Sr[2] = 1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.)
-                Sr[3] = -1./6. * (1.-r_local)**3
+                Sr = ( -1./6. * (r_local-2.)**3,
+                    1./6. * (3.*(r_local-1.)**3 - 6.*(r_local-1.)**2 + 4.),
+                    1./6. * (3.*(2.-r_local)**3 - 6.*(2.-r_local)**2 + 4.),
+                    -1./6. * (1.-r_local)**3 )
                 iz_lowest = int64(math.floor(z_cell)) - 1
                 z_local = z_cell-iz_lowest
-                Sz[0] = -1./6. * (z_local-2.)**3
-                Sz[1] = 1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.)
-                Sz[2] = 1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.)
-                Sz[3] = -1./6. * (1.-z_local)**3
-
-                # E-Field
-                # -------
-                Fr = 0.
-                Ft = 0.
-                Fz = 0.
-                # Add contribution from mode m
-                Fr, Ft, Fz = add_cubic_gather_for_mode( m,
-                    Fr, Ft, Fz, exptheta_m, Er_m, Et_m, Ez_m,
-                    ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
-                # Convert to Cartesian coordinates
-                # and write to particle field arrays
-                Ex[i] += cos*Fr - sin*Ft
-                Ey[i] += sin*Fr + cos*Ft
-                Ez[i] += Fz
-
-                # B-Field
-                # -------
-                # Clear the placeholders for the
-                # gathered field for each coordinate
-                Fr = 0.
-                Ft = 0.
-                Fz = 0.
+                Sz = ( -1./6. * (z_local-2.)**3,
+                    1./6. * (3.*(z_local-1.)**3 - 6.*(z_local-1.)**2 + 4.),
+                    1./6. * (3.*(2.-z_local)**3 - 6.*(2.-z_local)**2 + 4.),
+                    -1./6. * (1.-z_local)**3 )
+
+                # E and B fields, in cylindrical coordinates
+                # ------------------------------------------
+                Er = 0.
+                Et = 0.
+                Ez_cyl = 0.
+                Br = 0.
+                Bt = 0.
+                Bz_cyl = 0.
                 # Add contribution from mode m
-                Fr, Ft, Fz = add_cubic_gather_for_mode( m,
-                    Fr, Ft, Fz, exptheta_m, Br_m, Bt_m, Bz_m,
+                Er, Et, Ez_cyl, Br, Bt, Bz_cyl = add_cubic_gather_EB_for_mode( m,
+                    Er, Et, Ez_cyl, Br, Bt, Bz_cyl, exptheta_m, E_m, B_m,
                     ir_lowest, iz_lowest, Sr, Sz, Nr, Nz )
                 # Convert to Cartesian coordinates
                 # and write to particle field arrays
-                Bx[i] += cos*Fr - sin*Ft
-                By[i] += sin*Fr + cos*Ft
-                Bz[i] += Fz
+                Ex[i] += cos*Er - sin*Et
+                Ey[i] += sin*Er + cos*Et
+                Ez[i] += Ez_cyl
+                Bx[i] += cos*Br - sin*Bt
+                By[i] += sin*Br + cos*Bt
+                Bz[i] += Bz_cyl
 
     return Ex, Ey, Ez, Bx, By, Bz
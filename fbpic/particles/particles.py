@@ -19,14 +19,19 @@ from .push.numba_methods import push_p_numba, push_p_ioniz_numba, \
                                 push_p_after_plane_numba, push_x_numba
 from .gathering.threading_methods import gather_field_numba_linear, \
         gather_field_numba_cubic
+from .gathering.threading_methods_all_modes import \
+    gather_field_numba_linear_all_modes, gather_field_numba_cubic_all_modes
 from .gathering.threading_methods_one_mode import erase_eb_numba, \
-    gather_field_numba_linear_one_mode, gather_field_numba_cubic_one_mode
+    gather_field_numba_cubic_one_mode
+from .utilities.threading_sorting import get_cell_idx_per_particle_numba, \
+    get_sorted_idx_numba, write_sorting_buffer_numba
 from .deposition.threading_methods import \
         deposit_rho_numba_linear, deposit_rho_numba_cubic, \
         deposit_J_numba_linear, deposit_J_numba_cubic
 
 # Check if threading is enabled
-from fbpic.utils.threading import nthreads, get_chunk_indices
+from fbpic.utils.threading import nthreads, get_chunk_indices, \
+    cpu_sorting_period
 # Check if CUDA is available, then import CUDA functions
 from fbpic.utils.cuda import cuda_installed
 if cuda_installed:
@@ -170,6 +175,10 @@ class Particles(object) :
         self.w = w
 
         # Initialize the fields array (at the positions of the particles)
+        # (These are kept as separate 1d arrays: the gathering kernels write
+        # each of them sequentially, so that the cache lines that are written
+        # are fully used, and each array can be swapped with the sorting
+        # buffers or reallocated independently.)
         self.Ez = np.zeros( Ntot )
         self.Ex = np.zeros( Ntot )
         self.Ey = np.zeros( Ntot )
@@ -207,6 +216,10 @@ class Particles(object) :
         # (gets modified during the main PIC loop, on GPU)
         self.keep_fields_sorted = False
 
+        # Register the number of field gatherings since the particles were
+        # last sorted on CPU (only used if FBPIC_CPU_SORTING_PERIOD is set)
+        self.n_gather_since_cpu_sort = 0
+
         # Allocate arrays and register variables when using CUDA
         if self.use_cuda:
             if grid_shape is None:
@@ -237,6 +250,14 @@ class Particles(object) :
             else:
                 self.deposit_tpb = 16 if cuda_gpu_model == "V100" else 8
                 self.gather_tpb = 128
+        else:
+            # Arrays for the (optional) sorting of the particles on CPU
+            # (allocated at the first sorting, see `sort_particles_cpu`)
+            self.cell_idx = None
+            self.sorted_idx = None
+            self.prefix_sum = None
+            self.sorting_buffer = None
+            self.int_sorting_buffer = None
 
 
     def send_particles_to_gpu( self ):
@@ -548,6 +569,68 @@ class Particles(object) :
             # Assign the old particle data array to the particle buffer
             self.int_sorting_buffer = particle_array
 
+    def sort_particles_cpu( self, grid ):
+        """
+        Sort the particles by cell on CPU, and rearrange the particle arrays
+        accordingly (using a buffer that is swapped with the particle arrays).
+
+        The fields on the particles (Ex, Ey, ...) are not rearranged,
+        since this is called right before gathering the fields.
+
+        Parameter
+        ----------
+        grid : a list of InterpolationGrid objects
+             (one InterpolationGrid object per azimuthal mode)
+        """
+        # The sorting arrays are kept between sortings, and only
+        # reallocated when the number of particles has changed
+        Ntot = self.Ntot
+        Ncells = grid[0].Nz*(grid[0].Nr+1)
+        if self.cell_idx is None or self.cell_idx.shape[0] != Ntot:
+            self.cell_idx = np.empty( Ntot, dtype=np.int32 )
+            self.sorted_idx = np.empty( Ntot, dtype=np.int64 )
+        if self.prefix_sum is None or self.prefix_sum.shape[0] != Ncells+1:
+            self.prefix_sum = np.empty( Ncells+1, dtype=np.int64 )
+
+        # Get the cell index of each particle, and the sorted indices
+        get_cell_idx_per_particle_numba( self.cell_idx,
+            self.x, self.y, self.z,
+            grid[0].invdz, grid[0].zmin, grid[0].Nz,
+            grid[0].invdr, grid[0].rmin, grid[0].Nr )
+        get_sorted_idx_numba( self.cell_idx, self.prefix_sum, self.sorted_idx )
+
+        # Iterate over (float) particle attributes
+        attr_list = [ (self,'x'), (self,'y'), (self,'z'), \
+                        (self,'ux'), (self,'uy'), (self,'uz'), \
+                        (self, 'w'), (self,'inv_gamma') ]
+        if self.ionizer is not None:
+            attr_list += [ (self.ionizer,'w_times_level') ]
+        if self.sorting_buffer is None or self.sorting_buffer.shape[0] != Ntot:
+            self.sorting_buffer = np.empty( Ntot, dtype=np.float64 )
+        for attr in attr_list:
+            # Write particle data to the buffer while rearranging, and
+            # swap the buffer with the initial particle data array
+            particle_array = getattr( attr[0], attr[1] )
+            write_sorting_buffer_numba(
+                self.sorted_idx, particle_array, self.sorting_buffer )
+            setattr( attr[0], attr[1], self.sorting_buffer )
+            self.sorting_buffer = particle_array
+        # Iterate over (integer) particle attributes
+        attr_list = [ ]
+        if self.tracker is not None:
+            attr_list += [ (self.tracker,'id') ]
+        if self.ionizer is not None:
+            attr_list += [ (self.ionizer,'ionization_level') ]
+        if len(attr_list) > 0 and ( self.int_sorting_buffer is None
+                            or self.int_sorting_buffer.shape[0] != Ntot ):
+            self.int_sorting_buffer = np.empty( Ntot, dtype=np.uint64 )
+        for attr in attr_list:
+            particle_array = getattr( attr[0], attr[1] )
+            write_sorting_buffer_numba(
+                self.sorted_idx, particle_array, self.int_sorting_buffer )
+            setattr( attr[0], attr[1], self.int_sorting_buffer )
+            self.int_sorting_buffer = particle_array
+
     def push_p( self, t ) :
         """
         Advance the particles' momenta over one timestep, using the Vay pusher
@@ -705,10 +788,8 @@ class Particles(object) :
                          rmax_gather,
                          grid[0].invdz, grid[0].zmin, grid[0].Nz,
                          grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                         grid[0].Er, grid[0].Et, grid[0].Ez,
-                         grid[1].Er, grid[1].Et, grid[1].Ez,
-                         grid[0].Br, grid[0].Bt, grid[0].Bz,
-                         grid[1].Br, grid[1].Bt, grid[1].Bz,
+                         grid[0].E_stack, grid[1].E_stack,
+                         grid[0].B_stack, grid[1].B_stack,
                          self.Ex, self.Ey, self.Ez,
                          self.Bx, self.By, self.Bz)
                 else:
@@ -723,8 +804,7 @@ class Particles(object) :
                             rmax_gather,
                             grid[m].invdz, grid[m].zmin, grid[m].Nz,
                             grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
+                            grid[m].E_stack, grid[m].B_stack, m,
                             self.Ex, self.Ey, self.Ez,
                             self.Bx, self.By, self.Bz)
             elif self.particle_shape == 'cubic':
@@ -735,10 +815,8 @@ class Particles(object) :
                          rmax_gather,
                          grid[0].invdz, grid[0].zmin, grid[0].Nz,
                          grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                         grid[0].Er, grid[0].Et, grid[0].Ez,
-                         grid[1].Er, grid[1].Et, grid[1].Ez,
-                         grid[0].Br, grid[0].Bt, grid[0].Bz,
-                         grid[1].Br, grid[1].Bt, grid[1].Bz,
+                         grid[0].E_stack, grid[1].E_stack,
+                         grid[0].B_stack, grid[1].B_stack,
                          self.Ex, self.Ey, self.Ez,
                          self.Bx, self.By, self.Bz)
                 else:
@@ -753,8 +831,7 @@ class Particles(object) :
                             rmax_gather,
                             grid[m].invdz, grid[m].zmin, grid[m].Nz,
                             grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
+                            grid[m].E_stack, grid[m].B_stack, m,
                             self.Ex, self.Ey, self.Ez,
                             self.Bx, self.By, self.Bz)
             else:
@@ -763,6 +840,16 @@ class Particles(object) :
                                    but is `%s`" % self.particle_shape)
         # CPU version
         else:
+            # Periodically sort the particles by cell, if requested
+            # (improves the locality of the memory accesses to the grid)
+            if cpu_sorting_period > 0:
+                if self.n_gather_since_cpu_sort % cpu_sorting_period == 0:
+                    self.sort_particles_cpu( grid )
+                    self.n_gather_since_cpu_sort = 0
+                self.n_gather_since_cpu_sort += 1
+            # Divide particles into chunks (each chunk is handled by a
+            # different thread) and return the indices that bound chunks
+            ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
             if self.particle_shape == 'linear':
                 if Nm == 2:
                     # Optimized version for 2 modes
@@ -771,31 +858,25 @@ class Particles(object) :
                         rmax_gather,
                         grid[0].invdz, grid[0].zmin, grid[0].Nz,
                         grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        grid[0].Er, grid[0].Et, grid[0].Ez,
-                        grid[1].Er, grid[1].Et, grid[1].Ez,
-                        grid[0].Br, grid[0].Bt, grid[0].Bz,
-                        grid[1].Br, grid[1].Bt, grid[1].Bz,
+                        grid[0].E_gather_stack, grid[1].E_gather_stack,
+                        grid[0].B_gather_stack, grid[1].B_gather_stack,
                         self.Ex, self.Ey, self.Ez,
-                        self.Bx, self.By, self.Bz)
+                        self.Bx, self.By, self.Bz,
+                        nthreads, ptcl_chunk_indices )
                 else:
                     # Generic version for arbitrary number of modes
-                    erase_eb_numba( self.Ex, self.Ey, self.Ez,
-                                    self.Bx, self.By, self.Bz, self.Ntot )
-                    for m in range(Nm):
-                        gather_field_numba_linear_one_mode(
-                            self.x, self.y, self.z,
-                            rmax_gather,
-                            grid[m].invdz, grid[m].zmin, grid[m].Nz,
-                            grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
-                            self.Ex, self.Ey, self.Ez,
-                            self.Bx, self.By, self.Bz
-                        )
+                    # (all the modes are gathered in one pass)
+                    gather_field_numba_linear_all_modes(
+                        self.x, self.y, self.z,
+                        rmax_gather,
+                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                        tuple( grid[m].E_gather_stack for m in range(Nm) ),
+                        tuple( grid[m].B_gather_stack for m in range(Nm) ),
+                        self.Ex, self.Ey, self.Ez,
+                        self.Bx, self.By, self.Bz,
+                        nthreads, ptcl_chunk_indices )
             elif self.particle_shape == 'cubic':
-                # Divide particles into chunks (each chunk is handled by a
-                # different thread) and return the indices that bound chunks
-                ptcl_chunk_indices = get_chunk_indices(self.Ntot, nthreads)
                 if Nm == 2:
                     # Optimized version for 2 modes
                     gather_field_numba_cubic(
@@ -803,15 +884,29 @@ class Particles(object) :
                         rmax_gather,
                         grid[0].invdz, grid[0].zmin, grid[0].Nz,
                         grid[0].invdr, grid[0].rmin, grid[0].Nr,
-                        grid[0].Er, grid[0].Et, grid[0].Ez,
-                        grid[1].Er, grid[1].Et, grid[1].Ez,
-                        grid[0].Br, grid[0].Bt, grid[0].Bz,
-                        grid[1].Br, grid[1].Bt, grid[1].Bz,
+                        grid[0].E_gather_stack, grid[1].E_gather_stack,
+                        grid[0].B_gather_stack, grid[1].B_gather_stack,
+                        self.Ex, self.Ey, self.Ez,
+                        self.Bx, self.By, self.Bz,
+                        nthreads, ptcl_chunk_indices )
+                elif cpu_sorting_period > 0:
+                    # Generic version for arbitrary number of modes
+                    # (all the modes are gathered in one pass ; this is
+                    # only faster when the particles are sorted by cell)
+                    gather_field_numba_cubic_all_modes(
+                        self.x, self.y, self.z,
+                        rmax_gather,
+                        grid[0].invdz, grid[0].zmin, grid[0].Nz,
+                        grid[0].invdr, grid[0].rmin, grid[0].Nr,
+                        tuple( grid[m].E_gather_stack for m in range(Nm) ),
+                        tuple( grid[m].B_gather_stack for m in range(Nm) ),
                         self.Ex, self.Ey, self.Ez,
                         self.Bx, self.By, self.Bz,
                         nthreads, ptcl_chunk_indices )
                 else:
                     # Generic version for arbitrary number of modes
+                    # (one mode at a time, which has a smaller working set
+                    # when the particles are in random order)
                     erase_eb_numba( self.Ex, self.Ey, self.Ez,
                                     self.Bx, self.By, self.Bz, self.Ntot )
                     for m in range(Nm):
@@ -820,8 +915,7 @@ class Particles(object) :
                             rmax_gather,
                             grid[m].invdz, grid[m].zmin, grid[m].Nz,
                             grid[m].invdr, grid[m].rmin, grid[m].Nr,
-                            grid[m].Er, grid[m].Et, grid[m].Ez,
-                            grid[m].Br, grid[m].Bt, grid[m].Bz, m,
+                            grid[m].E_gather_stack, grid[m].B_gather_stack, m,
                             self.Ex, self.Ey, self.Ez,
                             self.Bx, self.By, self.Bz,
                             nthreads, ptcl_chunk_indices )
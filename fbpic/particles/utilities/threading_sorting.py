@@ -0,0 +1,139 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This file is part of the Fourier-Bessel Particle-In-Cell code (FB-PIC)
+It defines the particle sorting methods on the CPU with threading.
+
+(On CPU, sorting is optional: it is only used to improve the locality of
+the memory accesses to the grid, in the field gathering.)
+"""
+import math
+import numba
+from fbpic.utils.threading import njit_parallel, prange
+
+@njit_parallel
+def get_cell_idx_per_particle_numba(cell_idx, x, y, z,
+                                    invdz, zmin, Nz,
+                                    invdr, rmin, Nr):
+    """
+    Get the cell index of each particle.
+    (Same definition of the cell index as for `get_cell_idx_per_particle`
+    on GPU: cell index in r + cell index in z * (Nr+1))
+
+    Parameters
+    ----------
+    cell_idx : 1darray of integers
+        The cell index of the particle
+        (is modified by this function)
+
+    x, y, z : 1darray of floats (in meters)
+        The position of the particles
+
+    invdz, invdr : float (in meters^-1)
+        Inverse of the grid step along the considered direction
+
+    zmin, rmin : float (in meters)
+        Position of the edge of the simulation box, in each direction
+
+    Nz, Nr : int
+        Number of gridpoints along the considered direction
+    """
+    for i in prange(cell_idx.shape[0]):
+        # Preliminary arrays for the cylindrical conversion
+        xj = x[i]
+        yj = y[i]
+        zj = z[i]
+        rj = math.sqrt( xj**2 + yj**2 )
+
+        # Positions of the particles, in the cell unit
+        r_cell =  invdr*(rj - rmin) - 0.5
+        z_cell =  invdz*(zj - zmin) - 0.5
+
+        # Original index of the uppper grid point in z and r
+        ir_upper = int(math.ceil( r_cell ))
+        iz_upper = int(math.ceil( z_cell ))
+
+        # Treat the boundary conditions
+        # absorbing in upper r
+        if ir_upper > Nr:
+            ir_upper = Nr
+        # periodic boundaries in z
+        if iz_upper < 0:
+            iz_upper += Nz
+        elif iz_upper > Nz-1:
+            iz_upper -= Nz
+        # Clamp the indices to the grid, for particles that are more
+        # than one box length away (or that have a NaN position), so that
+        # the cell index is always a valid index for the counting sort
+        ir_upper = min( max( ir_upper, 0 ), Nr )
+        iz_upper = min( max( iz_upper, 0 ), Nz-1 )
+
+        # Calculate the 1D cell_idx
+        cell_idx[i] = ir_upper + iz_upper * (Nr+1)
+
+    return( cell_idx )
+
+@numba.njit
+def get_sorted_idx_numba(cell_idx, cell_start, sorted_idx):
+    """
+    Get the indices that sort the particles by cell index, using a
+    counting sort (histogram of the cell indices, prefix sum and scatter).
+
+    This is stable (particles in the same cell keep their relative order),
+    i.e. equivalent to `np.argsort(cell_idx, kind='stable')`, but scales
+    linearly with the number of particles and cells.
+
+    Parameters
+    ----------
+    cell_idx : 1darray of integers
+        The cell index of each particle
+
+    cell_start : 1darray of integers
+        Work array of size Ncells+1, where Ncells is the total number of
+        cells (upper bound of the cell indices)
+        (is modified by this function)
+
+    sorted_idx : 1darray of integers
+        The original index of the particle before the sorting
+        (is modified by this function)
+    """
+    Ncells = cell_start.shape[0] - 1
+    # Count the number of particles per cell, and compute its prefix sum
+    # (i.e. the index of the first particle of each cell, after sorting)
+    cell_start[:] = 0
+    for i in range(cell_idx.shape[0]):
+        cell_start[ cell_idx[i]+1 ] += 1
+    for i_cell in range(Ncells):
+        cell_start[ i_cell+1 ] += cell_start[ i_cell ]
+    # Scatter the particle indices to their sorted position
+    for i in range(cell_idx.shape[0]):
+        i_cell = cell_idx[i]
+        sorted_idx[ cell_start[i_cell] ] = i
+        cell_start[ i_cell ] += 1
+
+    return( sorted_idx )
+
+@njit_parallel
+def write_sorting_buffer_numba(sorted_idx, val, buf):
+    """
+    Writes the values of a particle array to a buffer,
+    while rearranging them to match the sorted cell index array.
+
+    Parameters
+    ----------
+    sorted_idx : 1darray of integers
+        Represents the original index of the
+        particle before the sorting
+
+    val : 1d array of floats
+        A particle data array
+
+    buf : 1d array of floats
+        A buffer array to temporarily store the
+        sorted particle data array
+    """
+    for i in prange(val.shape[0]):
+        buf[i] = val[sorted_idx[i]]
+
+    return( buf )
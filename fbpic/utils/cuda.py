@@ -135,6 +135,29 @@ def receive_data_from_gpu(simulation):
     # Receive fields from the GPU (if CUDA is used)
     simulation.fld.receive_fields_from_gpu()
 
+def memcpy_2d_async( dst, src, stream ):
+    """
+    Copy the GPU array `src` into the GPU array `dst` with a single
+    (pitched) 2D memory copy, enqueued on `stream`.
+
+    The first axis of the arrays is treated as the rows of the copy, and
+    may be strided (e.g. a slice along the second axis of a larger array).
+    The remaining axes need to be contiguous.
+
+    Parameters :
+    ------------
+    dst, src : cupy.ndarray
+        Destination and source arrays (of identical shape and dtype)
+
+    stream : cupy.cuda.Stream
+        The stream on which the copy is enqueued
+    """
+    n_rows = src.shape[0]
+    width = src[0].nbytes
+    cupy.cuda.runtime.memcpy2DAsync(
+        dst.data.ptr, dst.strides[0], src.data.ptr, src.strides[0],
+        width, n_rows, cupy.cuda.runtime.memcpyDefault, stream.ptr )
+
 class GpuMemoryManager(object):
     """
     Context manager that temporarily moves the simulation data to the GPU,
@@ -218,6 +241,37 @@ def get_uuid(gpu_id):
     return fmt % tuple(bytes(uuid))
 
 
+def is_integrated_gpu():
+    """
+    Returns whether the current GPU device is an integrated GPU,
+    i.e. whether it shares its physical memory with the host
+    (e.g. NVIDIA Jetson/Tegra systems)
+
+    Returns:
+    --------
+    integrated: bool
+    """
+    gpu_id = cupy.cuda.Device().id
+    return bool( cupy.cuda.runtime.getDeviceProperties(gpu_id)['integrated'] )
+
+
+def has_concurrent_managed_access():
+    """
+    Returns whether the host can access managed memory while kernels are
+    running on the current GPU device (device attribute
+    cudaDevAttrConcurrentManagedAccess). This is not the case e.g. on older
+    NVIDIA Jetson systems, where the host must not touch managed memory
+    while any kernel is running.
+
+    Returns:
+    --------
+    concurrent_access: bool
+    """
+    gpu_id = cupy.cuda.Device().id
+    return bool( cupy.cuda.runtime.getDeviceProperties(gpu_id)[
+                    'concurrentManagedAccess'] )
+
+
 def check_consecutive_ranks_on_same_nodes(mpi):
     """
     Check that consecutive MPI ranks are on the same nodes, and
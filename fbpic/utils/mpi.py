@@ -24,14 +24,45 @@ try:
     # Check if the environment variable FBPIC_ENABLE_GPUDIRECT is set to 1
     # and in that case, enable direct MPI communication of CUDA GPU arrays
     # with a CUDA-aware MPI Implementation
+    # (If it is set to `auto`, enable it only if the MPI implementation
+    # reports that it supports CUDA at runtime)
     if 'FBPIC_ENABLE_GPUDIRECT' in os.environ:
-        if int(os.environ['FBPIC_ENABLE_GPUDIRECT']) == 1:
+        if os.environ['FBPIC_ENABLE_GPUDIRECT'].lower() == 'auto':
+            # MPI.Query_cuda_support is only available with mpi4py>=4.0
+            if hasattr( MPI, 'Query_cuda_support' ):
+                gpudirect_enabled = bool( MPI.Query_cuda_support() )
+            else:
+                gpudirect_enabled = False
+        elif int(os.environ['FBPIC_ENABLE_GPUDIRECT']) == 1:
             gpudirect_enabled = True
         else:
             gpudirect_enabled = False
     else:
         gpudirect_enabled = False
 
+    # Check if the environment variable FBPIC_ENABLE_MAPPED_BUFFERS is set
+    # to 1 and in that case, allocate the MPI buffers of the fields as
+    # page-locked host memory that is mapped into the GPU address space
+    # (zero-copy), instead of separate host and device buffers
+    if 'FBPIC_ENABLE_MAPPED_BUFFERS' in os.environ:
+        if int(os.environ['FBPIC_ENABLE_MAPPED_BUFFERS']) == 1:
+            mapped_buffers_enabled = True
+        else:
+            mapped_buffers_enabled = False
+    else:
+        mapped_buffers_enabled = False
+
+    # Check if the environment variable FBPIC_ENABLE_MPI_RMA is set to 1
+    # and in that case, sum the guard cells of J and rho between domains
+    # with one-sided MPI communications (MPI_Accumulate), when running on CPU
+    if 'FBPIC_ENABLE_MPI_RMA' in os.environ:
+        if int(os.environ['FBPIC_ENABLE_MPI_RMA']) == 1:
+            mpi_rma_enabled = True
+        else:
+            mpi_rma_enabled = False
+    else:
+        mpi_rma_enabled = False
+
     if gpudirect_enabled:
         mpi4py_version_number = mpi4py.__version__.split('.')
         mpi4py_major_version = int(mpi4py_version_number[0])
@@ -73,3 +104,5 @@ except ImportError:
     mpi_type_dict = {}
     mpi_installed = False
     gpudirect_enabled = False
+    mapped_buffers_enabled = False
+    mpi_rma_enabled = False
@@ -47,11 +47,48 @@ if 'FBPIC_DISABLE_CACHING' in os.environ:
     if int(os.environ['FBPIC_DISABLE_CACHING']) == 1:
         caching = False
 
+# Check if the environment variable FBPIC_CPU_SORTING_PERIOD is set
+# and in that case, sort the particles by cell on CPU every
+# FBPIC_CPU_SORTING_PERIOD field gatherings (to improve the locality
+# of the memory accesses to the grid in the field gathering)
+cpu_sorting_period = 0
+if 'FBPIC_CPU_SORTING_PERIOD' in os.environ:
+    cpu_sorting_period = int(os.environ['FBPIC_CPU_SORTING_PERIOD'])
+
+# Check if the environment variable FBPIC_CPU_GATHER_PRECISION is set
+# to `single` and in that case, gather the fields on CPU from a
+# single-precision copy of E and B (halves the memory traffic to the grid)
+cpu_gather_precision = 'double'
+if 'FBPIC_CPU_GATHER_PRECISION' in os.environ:
+    cpu_gather_precision = os.environ['FBPIC_CPU_GATHER_PRECISION'].lower()
+    if cpu_gather_precision not in ['single', 'double']:
+        raise ValueError('FBPIC_CPU_GATHER_PRECISION should be either '
+            '`single` or `double`, but is `%s`' %cpu_gather_precision)
+
+# Check if the environment variable FBPIC_CPU_GATHER_LAYOUT is set to
+# `interleaved` and in that case, gather the fields on CPU from a copy of
+# E and B in which the 6 components of each cell are contiguous in memory
+# (fewer cache lines are then touched per cell of the gathering stencil)
+cpu_gather_layout = 'planar'
+if 'FBPIC_CPU_GATHER_LAYOUT' in os.environ:
+    cpu_gather_layout = os.environ['FBPIC_CPU_GATHER_LAYOUT'].lower()
+    if cpu_gather_layout not in ['planar', 'interleaved']:
+        raise ValueError('FBPIC_CPU_GATHER_LAYOUT should be either '
+            '`planar` or `interleaved`, but is `%s`' %cpu_gather_layout)
+
+# Fast-math flags for the arithmetic-heavy particle kernels (e.g. field
+# gathering, ionization): allow reassociation and contraction into FMAs.
+# (The flags `nnan` and `ninf` are deliberately not included, so that
+# the kernels remain correct if NaN or infinite values occur.)
+fastmath_flags = { 'contract', 'arcp', 'nsz', 'afn', 'reassoc' }
+
 # Set the function njit_parallel and prange to the correct object
 if not threading_enabled:
     # Use regular serial compilation function
     # Uses `cache=True` to avoid re-compilation
     njit_parallel = njit( cache=caching )
+    njit_parallel_fastmath = njit( cache=caching,
+                    fastmath=fastmath_flags, error_model='numpy' )
     prange = range
     nthreads = 1
 else:
@@ -59,9 +96,17 @@ else:
     if numba_version[1] < 45:
         caching = False
     njit_parallel = njit( parallel=True, cache=caching )
+    njit_parallel_fastmath = njit( parallel=True, cache=caching,
+                    fastmath=fastmath_flags, error_model='numpy' )
     prange = numba_prange
     nthreads = numba.config.NUMBA_NUM_THREADS
 
+# Serial compilation function with the same fast-math options
+# (for the inline functions that are called by the above kernels ;
+# these are always inlined by Numba, also when called within a loop)
+njit_fastmath = njit( fastmath=fastmath_flags, error_model='numpy',
+                      inline='always' )
+
 
 def get_chunk_indices( Ntot, nthreads ):
     """
@@ -0,0 +1,115 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It checks the optional copies of E and B from which the fields are gathered
+on CPU (activated with the environment variables
+FBPIC_CPU_GATHER_PRECISION=single and/or FBPIC_CPU_GATHER_LAYOUT=interleaved):
+random fields are gathered onto the particles of a plasma, and the gathered
+fields are compared with the default gathering (in double precision,
+directly from E and B), for linear and cubic shapes.
+
+Usage:
+------
+$ python tests/test_cpu_gather_options.py
+or
+$ py.test -q tests/test_cpu_gather_options.py
+"""
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+import fbpic.fields.fields as fields_module
+
+# Parameters
+# ----------
+# The simulation box
+Nz = 64          # Number of gridpoints along z
+zmax = 20.e-6    # Length of the box along z (meters)
+Nr = 32          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+Nm = 3           # Number of modes used
+# The simulation timestep
+dt = zmax/Nz/c   # Timestep (seconds)
+
+# The particles
+p_zmin = 0.e-6   # Position of the beginning of the plasma (meters)
+p_zmax = 20.e-6  # Position of the end of the plasma (meters)
+p_rmin = 0.      # Minimal radial position of the plasma (meters)
+p_rmax = 20.e-6  # Maximal radial position of the plasma (meters)
+n_e = 2.e24      # Density (electrons.meters^-3)
+p_nz = 2         # Number of particles per cell along z
+p_nr = 2         # Number of particles per cell along r
+p_nt = 8         # Number of particles per cell along theta
+
+# -------------
+# Test function
+# -------------
+
+def test_cpu_gather_options_linear():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_gather_options( 'linear' )
+
+def test_cpu_gather_options_cubic():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    compare_gather_options( 'cubic' )
+
+def compare_gather_options( particle_shape ):
+    "Compare the gathered fields with the default gathering"
+    E_ref = gather_random_fields( particle_shape, 'double', 'planar' )
+
+    # Relative tolerance of each option (with respect to the maximum field)
+    for precision, layout, rtol in [ ('double', 'interleaved', 1.e-12),
+                                     ('single', 'planar', 1.e-6),
+                                     ('single', 'interleaved', 1.e-6) ]:
+        E_gathered = gather_random_fields( particle_shape, precision, layout )
+        for i in range(6):
+            atol = rtol*abs(E_ref[i]).max()
+            assert np.allclose( E_gathered[i], E_ref[i], atol=atol, rtol=0 )
+        print('The fields gathered with %s precision and %s layout agree '
+              'with the default gathering.' %(precision, layout) )
+
+def gather_random_fields( particle_shape, precision, layout ):
+    """
+    Gather random fields onto the particles, with the gathering options
+    `precision` and `layout`, and return Ex, Ey, Ez, Bx, By, Bz
+    """
+    # Set the options (which are otherwise set by the environment variables)
+    initial_options = ( fields_module.cpu_gather_precision,
+                        fields_module.cpu_gather_layout )
+    try:
+        fields_module.cpu_gather_precision = precision
+        fields_module.cpu_gather_layout = layout
+        # (The particles are initialized with random angles)
+        np.random.seed(0)
+        sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                p_zmin, p_zmax, p_rmin, p_rmax, p_nz, p_nr, p_nt, n_e,
+                use_cuda=False, particle_shape=particle_shape )
+        # Set random fields on the interpolation grid
+        EB_modes = sim.fld.EB_modes
+        EB_modes[...] = np.random.uniform( -1, 1, EB_modes.shape ) \
+                    + 1.j*np.random.uniform( -1, 1, EB_modes.shape )
+        # (The copy of E and B is only allocated when first updated)
+        assert sim.fld.EB_modes_gather is None
+        sim.fld.update_gather_fields()
+        use_copy = (precision == 'single') or (layout == 'interleaved')
+        assert (sim.fld.EB_modes_gather is not None) == use_copy
+        # Gather the fields
+        ptcl = sim.ptcl[0]
+        ptcl.gather( sim.fld.interp, sim.comm )
+    finally:
+        fields_module.cpu_gather_precision, \
+            fields_module.cpu_gather_layout = initial_options
+
+    return( [ ptcl.Ex, ptcl.Ey, ptcl.Ez, ptcl.Bx, ptcl.By, ptcl.Bz ] )
+
+# -------------------------
+# Launching the simulation
+# -------------------------
+
+if __name__ == '__main__' :
+
+    test_cpu_gather_options_linear()
+    test_cpu_gather_options_cubic()
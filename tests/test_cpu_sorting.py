@@ -0,0 +1,142 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the optional sorting of the particles by cell on CPU
+(activated with the environment variable FBPIC_CPU_SORTING_PERIOD):
+- The counting sort of the cell indices is compared with `np.argsort`,
+  for particles that are inside and outside of the box.
+- A short simulation is run with and without sorting, and
+  the resulting fields are compared.
+
+Usage:
+------
+$ python tests/test_cpu_sorting.py
+or
+$ py.test -q tests/test_cpu_sorting.py
+"""
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+import fbpic.particles.particles as particles_module
+from fbpic.particles.utilities.threading_sorting import \
+    get_cell_idx_per_particle_numba, get_sorted_idx_numba
+
+# Parameters
+# ----------
+# The simulation box
+Nz = 64          # Number of gridpoints along z
+zmax = 20.e-6    # Length of the box along z (meters)
+Nr = 32          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+# The simulation timestep
+dt = zmax/Nz/c   # Timestep (seconds)
+
+# The particles
+p_zmin = 0.e-6   # Position of the beginning of the plasma (meters)
+p_zmax = 20.e-6  # Position of the end of the plasma (meters)
+p_rmin = 0.      # Minimal radial position of the plasma (meters)
+p_rmax = 18.e-6  # Maximal radial position of the plasma (meters)
+n_e = 2.e24      # Density (electrons.meters^-3)
+p_nz = 2         # Number of particles per cell along z
+p_nr = 2         # Number of particles per cell along r
+p_nt = 4         # Number of particles per cell along theta
+uth = 0.01       # Thermal momentum of the electrons (in units of m_e c)
+
+N_step = 20      # Number of PIC iterations
+sorting_period = 3
+
+# -------------
+# Test function
+# -------------
+
+def test_cpu_sorted_idx():
+    "Check the counting sort against `np.argsort`"
+    Ntot = 100000
+    np.random.seed(0)
+    # Particles that are mostly inside the box, but some of them are
+    # more than one box length away from it
+    x = np.random.uniform( -2*rmax, 2*rmax, Ntot )
+    y = np.random.uniform( -2*rmax, 2*rmax, Ntot )
+    z = np.random.uniform( -2*zmax, 3*zmax, Ntot )
+    # Also include particles with a NaN position
+    x[:10] = np.nan
+    z[10:20] = np.nan
+
+    # Get the cell indices
+    dz = zmax/Nz
+    dr = rmax/Nr
+    cell_idx = np.empty( Ntot, dtype=np.int32 )
+    get_cell_idx_per_particle_numba( cell_idx, x, y, z,
+                                     1./dz, 0., Nz, 1./dr, 0., Nr )
+    Ncells = Nz*(Nr+1)
+    assert np.all( (cell_idx >= 0) & (cell_idx < Ncells) )
+
+    # Sort them and compare with numpy
+    cell_start = np.empty( Ncells+1, dtype=np.int64 )
+    sorted_idx = np.empty( Ntot, dtype=np.int64 )
+    get_sorted_idx_numba( cell_idx, cell_start, sorted_idx )
+    assert np.array_equal( np.sort(sorted_idx), np.arange(Ntot) )
+    assert np.array_equal( sorted_idx, np.argsort(cell_idx, kind='stable') )
+
+def test_cpu_sorting_simulation():
+    "Check that sorting the particles does not change the simulation"
+    # Run without sorting, and then with sorting
+    # (the module-level variable is set by FBPIC_CPU_SORTING_PERIOD)
+    initial_period = particles_module.cpu_sorting_period
+    try:
+        particles_module.cpu_sorting_period = 0
+        sim_unsorted = run_simulation()
+        particles_module.cpu_sorting_period = sorting_period
+        sim_sorted = run_simulation()
+    finally:
+        particles_module.cpu_sorting_period = initial_period
+
+    # The fields only differ by the order of the summation in the deposition
+    for m in range(Nm):
+        for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz', 'Jr', 'Jt', 'Jz']:
+            F_unsorted = getattr( sim_unsorted.fld.interp[m], field )
+            F_sorted = getattr( sim_sorted.fld.interp[m], field )
+            atol = 1.e-8*abs(F_unsorted).max()
+            assert np.allclose( F_sorted, F_unsorted, atol=atol, rtol=0 )
+    # The particles are the same, up to their order in memory
+    ptcl_unsorted = sim_unsorted.ptcl[0]
+    ptcl_sorted = sim_sorted.ptcl[0]
+    order_unsorted = np.lexsort( (ptcl_unsorted.x, ptcl_unsorted.z) )
+    order_sorted = np.lexsort( (ptcl_sorted.x, ptcl_sorted.z) )
+    for attr in ['x', 'y', 'z', 'ux', 'uy', 'uz']:
+        assert np.allclose(
+            getattr( ptcl_sorted, attr )[order_sorted],
+            getattr( ptcl_unsorted, attr )[order_unsorted],
+            rtol=1.e-8, atol=1.e-14 )
+
+def run_simulation():
+    "Run a short simulation of a thermal plasma on CPU"
+    # (The particles are initialized with random angles)
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                  p_zmin, p_zmax, p_rmin, p_rmax, p_nz, p_nr,
+                  p_nt, n_e, use_cuda=False,
+                  boundaries={'z':'periodic', 'r':'reflective'} )
+    # Impart random momenta to the electrons
+    ptcl = sim.ptcl[0]
+    ptcl.ux = uth*np.random.normal( size=ptcl.Ntot )
+    ptcl.uy = uth*np.random.normal( size=ptcl.Ntot )
+    ptcl.uz = uth*np.random.normal( size=ptcl.Ntot )
+    ptcl.inv_gamma = 1./np.sqrt( 1 + ptcl.ux**2 + ptcl.uy**2 + ptcl.uz**2 )
+
+    sim.step( N_step, show_progress=False )
+    return( sim )
+
+# -------------------------
+# Launching the simulation
+# -------------------------
+
+if __name__ == '__main__' :
+
+    test_cpu_sorted_idx()
+    test_cpu_sorting_simulation()
@@ -0,0 +1,223 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+r"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It tests the field gathering on CPU, for different numbers of azimuthal
+modes (including more than 2 modes, for which all the modes are gathered
+in one pass over the particles, or one mode at a time for the cubic shape
+when the particles are not sorted by cell) and for linear and cubic shapes.
+
+The fields on the interpolation grid are set to fields that are exactly
+reproduced by the linear and cubic interpolations (see below). The fields
+gathered on randomly-placed particles are then compared with the analytical
+fields, which are evaluated with the exact azimuthal factors
+$e^{-i m \theta}$ of each mode.
+
+Usage:
+------
+$ python tests/test_gathering.py
+or
+$ py.test -q tests/test_gathering.py
+
+Theory:
+-------
+The fields are given by their azimuthal modes, which are linear in z:
+$$ F_m(z,r) = (\alpha_m + \beta_m z) $$
+for the longitudinal components (Ez, Bz) with even m, and for the
+transverse components (Er, Et, Br, Bt) with odd m, and
+$$ F_m(z,r) = (\alpha_m + \beta_m z) r $$
+otherwise, where $\alpha_m$ and $\beta_m$ are random complex numbers
+(and where z and r are normalized by the size of the box).
+These fields have the parity across the axis that is assumed by the field
+gathering, and are linear in r and z, so that they are exactly
+reproduced by the linear and cubic interpolations (away from the
+boundaries in z and from the upper boundary in r).
+
+The fields in 3D are then
+$$ F(r,\theta,z) = \mathrm{Re}\left[ F_0(z,r)
+ + 2\sum_{m \geq 1} F_m(z,r) e^{-i m \theta} \right] $$
+
+In addition, for the cubic shape, the fields gathered one mode at a time
+are compared with the fields gathered with all the modes in one pass.
+"""
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+import fbpic.particles.particles as particles_module
+from fbpic.utils.threading import nthreads, get_chunk_indices
+from fbpic.particles.gathering.threading_methods_all_modes import \
+    gather_field_numba_cubic_all_modes
+from fbpic.particles.gathering.threading_methods_one_mode import \
+    erase_eb_numba, gather_field_numba_cubic_one_mode
+
+# Parameters
+# ----------
+# The simulation box
+Nz = 64          # Number of gridpoints along z
+zmax = 20.e-6    # Length of the box along z (meters)
+Nr = 32          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+list_Nm = [ 1, 2, 3, 6 ] # Numbers of modes used
+# The simulation timestep
+dt = zmax/Nz/c   # Timestep (seconds)
+
+# The particles
+p_zmin = 0.e-6   # Position of the beginning of the plasma (meters)
+p_zmax = 20.e-6  # Position of the end of the plasma (meters)
+p_rmin = 0.      # Minimal radial position of the plasma (meters)
+p_rmax = 20.e-6  # Maximal radial position of the plasma (meters)
+n_e = 2.e24      # Density (electrons.meters^-3)
+p_nz = 2         # Number of particles per cell along z
+p_nr = 2         # Number of particles per cell along r
+p_nt = 8         # Number of particles per cell along theta
+
+# -------------
+# Test function
+# -------------
+
+def test_gathering_linear_shape():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    for Nm in list_Nm:
+        check_gathering( Nm, 'linear' )
+
+def test_gathering_cubic_shape():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Without and with sorting of the particles (which selects
+    # the gathering kernel, for more than 2 modes)
+    for sorting_period in [ 0, 1 ]:
+        for Nm in list_Nm:
+            check_gathering( Nm, 'cubic', sorting_period )
+
+def test_gathering_cubic_one_mode_and_all_modes():
+    "Compare the cubic gathering of one mode at a time and of all the modes"
+    Nm = 3
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                p_zmin, p_zmax, p_rmin, p_rmax, p_nz, p_nr, p_nt, n_e,
+                use_cuda=False, particle_shape='cubic' )
+    grid = sim.fld.interp
+    # Set random fields on the interpolation grid
+    EB_modes = sim.fld.EB_modes
+    EB_modes[...] = np.random.uniform( -1, 1, EB_modes.shape ) \
+                + 1.j*np.random.uniform( -1, 1, EB_modes.shape )
+    sim.fld.update_gather_fields()
+
+    ptcl = sim.ptcl[0]
+    ptcl_chunk_indices = get_chunk_indices( ptcl.Ntot, nthreads )
+    args = ( ptcl.x, ptcl.y, ptcl.z, rmax,
+             grid[0].invdz, grid[0].zmin, grid[0].Nz,
+             grid[0].invdr, grid[0].rmin, grid[0].Nr )
+    # All the modes in one pass
+    EB_all_modes = [ np.empty( ptcl.Ntot ) for _ in range(6) ]
+    gather_field_numba_cubic_all_modes( *args,
+        tuple( grid[m].E_gather_stack for m in range(Nm) ),
+        tuple( grid[m].B_gather_stack for m in range(Nm) ),
+        *EB_all_modes, nthreads, ptcl_chunk_indices )
+    # One mode at a time
+    EB_one_mode = [ np.empty( ptcl.Ntot ) for _ in range(6) ]
+    erase_eb_numba( *EB_one_mode, ptcl.Ntot )
+    for m in range(Nm):
+        gather_field_numba_cubic_one_mode( *args,
+            grid[m].E_gather_stack, grid[m].B_gather_stack, m,
+            *EB_one_mode, nthreads, ptcl_chunk_indices )
+
+    for i in range(6):
+        atol = 1.e-12*abs(EB_all_modes[i]).max()
+        assert np.allclose( EB_one_mode[i], EB_all_modes[i],
+                            atol=atol, rtol=0 )
+
+def check_gathering( Nm, particle_shape, sorting_period=0 ):
+    "Gather the analytical fields and compare them with theory"
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                p_zmin, p_zmax, p_rmin, p_rmax, p_nz, p_nr, p_nt, n_e,
+                use_cuda=False, particle_shape=particle_shape )
+    dz = zmax/Nz
+    dr = rmax/Nr
+
+    # Set the fields on the interpolation grid
+    coefs = {}
+    for m in range(Nm):
+        grid = sim.fld.interp[m]
+        z, r = np.meshgrid( grid.z, grid.r, indexing='ij' )
+        for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz']:
+            coefs[field, m] = np.random.uniform( -1, 1, 4 )
+            getattr( grid, field )[...] = \
+                field_mode( field, m, coefs[field, m], z, r )
+
+    # Place the particles randomly, away from the boundaries in z
+    # and from the upper boundary in r (and a few on the axis)
+    ptcl = sim.ptcl[0]
+    N = ptcl.Ntot
+    r = np.random.uniform( 0, rmax - 3*dr, N )
+    theta = np.random.uniform( -np.pi, np.pi, N )
+    r[:10] = 0
+    theta[:10] = 0
+    ptcl.x = r*np.cos(theta)
+    ptcl.y = r*np.sin(theta)
+    ptcl.z = np.random.uniform( 2*dz, zmax - 3*dz, N )
+
+    # Gather the fields
+    # (the module-level variable is set by FBPIC_CPU_SORTING_PERIOD)
+    initial_period = particles_module.cpu_sorting_period
+    try:
+        particles_module.cpu_sorting_period = sorting_period
+        sim.fld.update_gather_fields()
+        ptcl.gather( sim.fld.interp, sim.comm )
+    finally:
+        particles_module.cpu_sorting_period = initial_period
+    # (The particles may have been sorted by the gathering)
+    r = np.sqrt( ptcl.x**2 + ptcl.y**2 )
+    theta = np.arctan2( ptcl.y, ptcl.x )
+
+    # Analytical fields, in cylindrical coordinates
+    F = {}
+    for field in ['Er', 'Et', 'Ez', 'Br', 'Bt', 'Bz']:
+        F[field] = field_mode( field, 0, coefs[field, 0], ptcl.z, r ).real
+        for m in range(1, Nm):
+            F[field] += 2*( field_mode( field, m, coefs[field, m], ptcl.z, r )
+                            * np.exp( -1.j*m*theta ) ).real
+    # Convert to Cartesian coordinates, and compare
+    F_theory = {
+        'Ex': np.cos(theta)*F['Er'] - np.sin(theta)*F['Et'],
+        'Ey': np.sin(theta)*F['Er'] + np.cos(theta)*F['Et'],
+        'Ez': F['Ez'],
+        'Bx': np.cos(theta)*F['Br'] - np.sin(theta)*F['Bt'],
+        'By': np.sin(theta)*F['Br'] + np.cos(theta)*F['Bt'],
+        'Bz': F['Bz'] }
+    for field in ['Ex', 'Ey', 'Ez', 'Bx', 'By', 'Bz']:
+        F_simulated = getattr( ptcl, field )
+        atol = 1.e-12*abs(F_theory[field]).max()
+        assert np.allclose( F_simulated, F_theory[field], atol=atol, rtol=0 )
+    print('The gathered fields agree with the theory, with %d modes and %s '
+          'shape (sorting period: %d).' %(Nm, particle_shape, sorting_period) )
+
+def field_mode( field, m, coefs, z, r ):
+    """
+    Return the azimuthal mode `m` of the field `field` at (z, r)
+    (see the docstring at the top of this file)
+    """
+    alpha = coefs[0] + 1.j*coefs[1]
+    beta = coefs[2] + 1.j*coefs[3]
+    # Normalize z and r to order unity
+    F = alpha + beta*z/zmax
+    if field in ['Ez', 'Bz']:
+        parity = m % 2
+    else:
+        parity = (m+1) % 2
+    if parity == 1:
+        F = F*r/rmax
+    return( F )
+
+# -------------------------
+# Launching the simulation
+# -------------------------
+
+if __name__ == '__main__' :
+
+    test_gathering_linear_shape()
+    test_gathering_cubic_shape()
+    test_gathering_cubic_one_mode_and_all_modes()
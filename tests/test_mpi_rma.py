@@ -0,0 +1,141 @@
+# Copyright 2016, FBPIC contributors
+# Authors: Remi Lehe, Manuel Kirchen
+# License: 3-Clause-BSD-LBNL
+"""
+This test file is part of FB-PIC (Fourier-Bessel Particle-In-Cell).
+
+It checks that the one-sided summation of the guard cells of J and rho
+between MPI domains (activated with FBPIC_ENABLE_MPI_RMA=1) gives the same
+result as the default exchange (with MPI_Isend/MPI_Irecv), on CPU:
+- A short simulation of a thermal plasma is run with both methods
+  (with periodic and open boundaries), and the resulting J and rho are
+  compared.
+- J is exchanged after reallocating the array of J on only one of the
+  domains (which requires all the domains to recreate their MPI window).
+
+Usage:
+------
+This file is meant to be run from the top directory of fbpic,
+by any of the following commands
+$ mpirun -np 2 python tests/test_mpi_rma.py
+$ py.test -q tests/test_mpi_rma.py
+(The latter launches the former.)
+"""
+import os
+import numpy as np
+from scipy.constants import c
+# Import the relevant structures in FBPIC
+from fbpic.main import Simulation
+import fbpic.boundaries.boundary_communicator as boundary_communicator
+
+# Parameters
+# ----------
+# The simulation box
+Nz = 128         # Number of gridpoints along z
+zmax = 40.e-6    # Length of the box along z (meters)
+Nr = 32          # Number of gridpoints along r
+rmax = 20.e-6    # Length of the box along r (meters)
+Nm = 2           # Number of modes used
+n_order = 8      # Order of the finite stencil
+# The simulation timestep
+dt = zmax/Nz/c   # Timestep (seconds)
+
+# The particles
+p_zmin = 0.e-6   # Position of the beginning of the plasma (meters)
+p_zmax = 40.e-6  # Position of the end of the plasma (meters)
+p_rmin = 0.      # Minimal radial position of the plasma (meters)
+p_rmax = 18.e-6  # Maximal radial position of the plasma (meters)
+n_e = 2.e24      # Density (electrons.meters^-3)
+p_nz = 2         # Number of particles per cell along z
+p_nr = 2         # Number of particles per cell along r
+p_nt = 4         # Number of particles per cell along theta
+uth = 0.01       # Thermal momentum of the electrons (in units of m_e c)
+
+N_step = 10      # Number of PIC iterations
+
+# -------------
+# Test function
+# -------------
+
+def test_mpi_rma():
+    "Function that is run by py.test, when doing `python setup.py test`"
+    # Launch this file with two MPI processes
+    command_line = 'NUMBA_NUM_THREADS=1 MKL_NUM_THREADS=1 '
+    command_line += 'mpirun -np 2 python %s' %os.path.abspath(__file__)
+    response = os.system( command_line )
+    assert response == 0
+
+def compare_rma_and_default( boundaries ):
+    "Compare J and rho after a short simulation, with and without RMA"
+    initial_rma_enabled = boundary_communicator.mpi_rma_enabled
+    try:
+        boundary_communicator.mpi_rma_enabled = False
+        sim_default = run_simulation( boundaries )
+        boundary_communicator.mpi_rma_enabled = True
+        sim_rma = run_simulation( boundaries )
+        check_exchange_after_reallocation( sim_rma )
+    finally:
+        boundary_communicator.mpi_rma_enabled = initial_rma_enabled
+
+    # The fields only differ by the order of the summation of the guard cells
+    for m in range(Nm):
+        for field in ['Jr', 'Jt', 'Jz', 'rho']:
+            F_default = getattr( sim_default.fld.interp[m], field )
+            F_rma = getattr( sim_rma.fld.interp[m], field )
+            atol = 1.e-12*abs(F_default).max()
+            assert np.allclose( F_rma, F_default, atol=atol, rtol=0 )
+    print('J and rho agree with and without RMA, with %s boundaries '
+          '(rank %d).' %(boundaries['z'], sim_rma.comm.rank) )
+
+def check_exchange_after_reallocation( sim ):
+    "Exchange J, after reallocating it on the first domain only"
+    interp = sim.fld.interp
+    J_modes = interp[0].J_modes
+    J_initial = J_modes.copy()
+
+    # Default exchange
+    boundary_communicator.mpi_rma_enabled = False
+    sim.comm.exchange_fields( interp, 'J', 'add' )
+    J_default = J_modes.copy()
+
+    # One-sided exchange
+    boundary_communicator.mpi_rma_enabled = True
+    if sim.comm.rank == 0:
+        interp[0].J_modes = J_initial.copy()
+    else:
+        J_modes[...] = J_initial
+    sim.comm.exchange_fields( interp, 'J', 'add' )
+    J_rma = interp[0].J_modes
+
+    atol = 1.e-12*abs(J_default).max()
+    assert np.allclose( J_rma, J_default, atol=atol, rtol=0 )
+    # Restore the array that is bound to the individual components
+    J_modes[...] = J_initial
+    interp[0].J_modes = J_modes
+
+def run_simulation( boundaries ):
+    "Run a short simulation of a thermal plasma on CPU"
+    # (The particles are initialized with random angles)
+    np.random.seed(0)
+    sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt,
+                  p_zmin, p_zmax, p_rmin, p_rmax, p_nz, p_nr,
+                  p_nt, n_e, n_order=n_order, use_cuda=False,
+                  boundaries=boundaries )
+    # Impart random momenta to the electrons
+    ptcl = sim.ptcl[0]
+    ptcl.ux = uth*np.random.normal( size=ptcl.Ntot )
+    ptcl.uy = uth*np.random.normal( size=ptcl.Ntot )
+    ptcl.uz = uth*np.random.normal( size=ptcl.Ntot )
+    ptcl.inv_gamma = 1./np.sqrt( 1 + ptcl.ux**2 + ptcl.uy**2 + ptcl.uz**2 )
+
+    sim.step( N_step, show_progress=False )
+    return( sim )
+
+# -------------------------
+# Launching the simulation
+# -------------------------
+
+if __name__ == '__main__' :
+
+    compare_rma_and_default( {'z':'periodic', 'r':'reflective'} )
+    compare_rma_and_default( {'z':'open', 'r':'reflective'} )